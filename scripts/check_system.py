@@ -1,87 +1,226 @@
 #!/usr/bin/env python
 import sys
 import os
+import re
 import platform
+import hashlib
+import site
+import ctypes
+import subprocess
+import importlib.metadata as im
 import psutil
-import torch
-import json
+import orjson
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger(__name__)
 
-def check_system():
-    """Проверка системных требований"""
-    results = {
-        "system": {},
-        "python": {},
-        "hardware": {},
-        "dependencies": {},
-        "directories": {},
-        "models": {}
-    }
-    
-    # Проверка системы
-    results["system"] = {
+ROOT_DIR = Path(__file__).resolve().parents[1]
+# Кэш проверки зависимостей: один файл, перезаписывается при смене ключа
+DEPS_CACHE_FILE = ROOT_DIR / "logs" / ".deps_cache.json"
+
+def _package_version(package: str):
+    """Версия установленного пакета или None, если пакет не найден"""
+    try:
+        return im.version(package)
+    except im.PackageNotFoundError:
+        return None
+
+def _probe_system():
+    """Проверка системы"""
+    return {
         "os": platform.system(),
         "release": platform.release(),
         "version": platform.version(),
         "architecture": platform.machine(),
         "processor": platform.processor()
     }
-    
-    # Проверка Python
-    results["python"] = {
+
+def _probe_python():
+    """Проверка Python"""
+    return {
         "version": sys.version.split()[0],
         "path": sys.executable,
-        "pip": os.popen("pip --version").read().strip()
+        "pip": _package_version("pip")
     }
-    
-    # Проверка оборудования
-    results["hardware"] = {
+
+def _probe_hw():
+    """Проверка оборудования"""
+    # Снимаем каждое показание один раз
+    vm = psutil.virtual_memory()
+    du = psutil.disk_usage('/')
+    freq = psutil.cpu_freq()
+    return {
         "cpu_cores": psutil.cpu_count(),
-        "cpu_freq": psutil.cpu_freq().max if psutil.cpu_freq() else "Unknown",
-        "memory_total": psutil.virtual_memory().total / (1024 ** 3),
-        "memory_available": psutil.virtual_memory().available / (1024 ** 3),
-        "disk_total": psutil.disk_usage('/').total / (1024 ** 3),
-        "disk_free": psutil.disk_usage('/').free / (1024 ** 3)
+        "cpu_freq": freq.max if freq else "Unknown",
+        "memory_total": vm.total / (1024 ** 3),
+        "memory_available": vm.available / (1024 ** 3),
+        "disk_total": du.total / (1024 ** 3),
+        "disk_free": du.free / (1024 ** 3)
     }
+
+def _probe_cuda_driver():
+    """Проверка CUDA через driver API (libcuda) без загрузки torch"""
+    try:
+        lib = ctypes.CDLL("nvcuda.dll" if os.name == "nt" else "libcuda.so.1")
+    except OSError:
+        return None
+    
+    count = ctypes.c_int()
+    if lib.cuInit(0) != 0 or lib.cuDeviceGetCount(ctypes.byref(count)) != 0:
+        return None
+    if count.value == 0:
+        return {}
+    
+    device = ctypes.c_int()
+    name = ctypes.create_string_buffer(256)
+    memory = ctypes.c_size_t()
+    version = ctypes.c_int()
+    if (lib.cuDeviceGet(ctypes.byref(device), 0) != 0
+            or lib.cuDeviceGetName(name, len(name), device) != 0
+            or lib.cuDeviceTotalMem_v2(ctypes.byref(memory), device) != 0
+            or lib.cuDriverGetVersion(ctypes.byref(version)) != 0):
+        return None
     
-    # Проверка CUDA
-    if torch.cuda.is_available():
-        results["hardware"].update({
-            "gpu": torch.cuda.get_device_name(0),
-            "cuda_version": torch.version.cuda,
-            "gpu_memory": torch.cuda.get_device_properties(0).total_memory / (1024 ** 3)
-        })
+    return {
+        "gpu": name.value.decode(),
+        "cuda_version": f"{version.value // 1000}.{version.value % 1000 // 10}",
+        "gpu_memory": memory.value / (1024 ** 3)
+    }
+
+def _smi_cuda_version():
+    """Версия CUDA из заголовка вывода nvidia-smi или None"""
+    try:
+        header = subprocess.run(
+            ["nvidia-smi"], capture_output=True, text=True, timeout=10, check=True
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = re.search(r"CUDA Version:\s*([\d.]+)", header)
+    return match.group(1) if match else None
+
+def _probe_cuda_smi():
+    """Проверка CUDA через nvidia-smi"""
+    try:
+        output = subprocess.run(
+            ["nvidia-smi", "--query-gpu=name,memory.total,driver_version",
+             "--format=csv,noheader,nounits"],
+            capture_output=True, text=True, timeout=10, check=True
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
     
-    # Проверка зависимостей
+    lines = output.strip().splitlines()
+    if not lines:
+        return {}
+    
+    # Имя GPU может содержать запятые, поэтому поля отделяются справа
+    fields = [value.strip() for value in lines[0].rsplit(",", 2)]
+    if len(fields) != 3:
+        return {}
+    name, memory, driver = fields
+    
+    try:
+        gpu_memory = float(memory) / 1024
+    except ValueError:
+        # nvidia-smi сообщает [N/A], если объем памяти недоступен
+        gpu_memory = None
+    
+    return {
+        "gpu": name,
+        "cuda_version": _smi_cuda_version(),
+        "driver_version": driver,
+        "gpu_memory": gpu_memory
+    }
+
+def _probe_cuda():
+    """Проверка CUDA"""
+    # torch не импортируем: его загрузка занимает секунды и сотни MB памяти
+    for probe in (_probe_cuda_driver, _probe_cuda_smi):
+        info = probe()
+        if info is not None:
+            return info
+    return {}
+
+def _site_packages_mtime():
+    """Время последнего изменения директорий site-packages"""
+    paths = site.getsitepackages() + [site.getusersitepackages()]
+    return max((os.stat(p).st_mtime for p in paths if os.path.isdir(p)), default=0.0)
+
+def _probe_deps():
+    """Проверка зависимостей"""
     required_packages = [
         "torch", "torchvision", "easyocr", "opencv-python",
         "numpy", "PySide6", "fastapi", "pika", "pandas"
     ]
-    results["dependencies"] = {
-        pkg: os.popen(f"pip show {pkg}").read().strip() 
-        for pkg in required_packages
+    
+    # Кэш действителен, пока не изменились requirements.txt и установленные пакеты
+    requirements = ROOT_DIR / "requirements.txt"
+    key = None
+    if requirements.exists():
+        key = hashlib.sha1(
+            requirements.read_bytes() + ",".join(required_packages).encode()
+        ).hexdigest()
+        try:
+            if DEPS_CACHE_FILE.stat().st_mtime > _site_packages_mtime():
+                cached = orjson.loads(DEPS_CACHE_FILE.read_bytes())
+                if cached.get("key") == key:
+                    return cached["dependencies"]
+        except (OSError, orjson.JSONDecodeError, AttributeError, KeyError):
+            pass
+    
+    dependencies = {
+        pkg: _package_version(pkg) for pkg in required_packages
     }
     
-    # Проверка директорий
+    if key is not None:
+        try:
+            DEPS_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            DEPS_CACHE_FILE.write_bytes(orjson.dumps({"key": key, "dependencies": dependencies}))
+        except OSError as e:
+            logger.debug(f"Не удалось сохранить кэш зависимостей: {e}")
+    
+    return dependencies
+
+def _probe_dirs():
+    """Проверка директорий"""
     required_dirs = [
         "data/input", "data/output", "data/temp", "data/backup",
         "logs", "models", "config"
     ]
-    results["directories"] = {
+    return {
         dir_: os.path.exists(dir_) for dir_ in required_dirs
     }
-    
-    # Проверка моделей
+
+def _probe_models():
+    """Проверка моделей"""
     model_files = [
         "models/yolov5s.pt"
     ]
-    results["models"] = {
+    return {
         model: os.path.exists(model) for model in model_files
     }
+
+def check_system():
+    """Проверка системных требований"""
+    # Проверки независимы друг от друга, поэтому выполняем их параллельно;
+    # инициализация CUDA идет в отдельном потоке и не задерживает остальные
+    probes = {
+        "system": _probe_system,
+        "python": _probe_python,
+        "hardware": _probe_hw,
+        "cuda": _probe_cuda,
+        "dependencies": _probe_deps,
+        "directories": _probe_dirs,
+        "models": _probe_models
+    }
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = {name: executor.submit(probe) for name, probe in probes.items()}
+        results = {name: future.result() for name, future in futures.items()}
+    
+    results["hardware"].update(results.pop("cuda"))
     
     return results
 
@@ -111,8 +250,10 @@ def print_results(results):
     if "gpu" in results["hardware"]:
         logger.info(f"\nGPU:")
         logger.info(f"  Модель: {results['hardware']['gpu']}")
-        logger.info(f"  CUDA: {results['hardware']['cuda_version']}")
-        logger.info(f"  Память: {results['hardware']['gpu_memory']:.1f} GB")
+        if results['hardware'].get('cuda_version'):
+            logger.info(f"  CUDA: {results['hardware']['cuda_version']}")
+        gpu_memory = results['hardware']['gpu_memory']
+        logger.info(f"  Память: {gpu_memory:.1f} GB" if gpu_memory is not None else "  Память: н/д")
     
     # Директории
     logger.info("\nДиректории:")
@@ -149,8 +290,9 @@ def main():
         # Сохраняем результаты в файл
         output_file = "logs/system_check.json"
         os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(results, f, indent=2, ensure_ascii=False)
+        Path(output_file).write_bytes(
+            orjson.dumps(results, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        )
         
         logger.info(f"\nРезультаты сохранены в {output_file}")
         
@@ -1,13 +1,62 @@
 #!/usr/bin/env python
 import os
-import shutil
 import logging
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+import tempfile
 from pathlib import Path
 
+import diskcache
+
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger(__name__)
 
+def _iter_files(root: str):
+    """Итеративный обход дерева через os.scandir, возвращает DirEntry файлов"""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+def _remove_tree(path: str) -> int:
+    """Удаление дерева за один проход, возвращает объем удаленных файлов"""
+    size = 0
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                size += _remove_tree(entry.path)
+            else:
+                size += entry.stat(follow_symlinks=False).st_size
+                os.unlink(entry.path)
+    os.rmdir(path)
+    return size
+
+def _unlink_parallel(candidates, kind: str, max_workers: int = 16):
+    """Параллельное удаление пар (путь, размер), возвращает (количество, объем)"""
+    count = 0
+    size = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(os.unlink, path): (path, file_size)
+            for path, file_size in candidates
+        }
+        for future in as_completed(futures):
+            path, file_size = futures[future]
+            try:
+                future.result()
+            except OSError as e:
+                # Занятый или уже удаленный файл не прерывает очистку
+                logger.warning(f"Не удалось удалить {kind} {path}: {e}")
+                continue
+            size += file_size
+            count += 1
+            logger.debug(f"Удален {kind}: {path}")
+    return count, size
+
 def cleanup_temp_files(temp_dir: str = "data/temp", max_age_days: int = 7):
     """Очистка временных файлов старше max_age_days"""
     temp_path = Path(temp_dir)
@@ -15,18 +64,15 @@ def cleanup_temp_files(temp_dir: str = "data/temp", max_age_days: int = 7):
         logger.warning(f"Директория {temp_dir} не существует")
         return
     
-    now = datetime.now()
-    count = 0
-    size = 0
+    cutoff = time.time() - max_age_days * 86400.0
     
-    for item in temp_path.glob("**/*"):
-        if item.is_file():
-            mtime = datetime.fromtimestamp(item.stat().st_mtime)
-            if now - mtime > timedelta(days=max_age_days):
-                size += item.stat().st_size
-                item.unlink()
-                count += 1
-                logger.debug(f"Удален файл: {item}")
+    def stale_files():
+        for entry in _iter_files(temp_dir):
+            st = entry.stat()
+            if st.st_mtime < cutoff:
+                yield entry.path, st.st_size
+    
+    count, size = _unlink_parallel(stale_files(), "файл")
     
     logger.info(f"Удалено {count} файлов (всего {size / 1024 / 1024:.1f} MB)")
 
@@ -37,18 +83,18 @@ def cleanup_logs(log_dir: str = "logs", max_age_days: int = 30):
         logger.warning(f"Директория {log_dir} не существует")
         return
     
-    now = datetime.now()
-    count = 0
-    size = 0
+    cutoff = time.time() - max_age_days * 86400.0
     
-    for item in log_path.glob("*.log*"):
-        if item.is_file():
-            mtime = datetime.fromtimestamp(item.stat().st_mtime)
-            if now - mtime > timedelta(days=max_age_days):
-                size += item.stat().st_size
-                item.unlink()
-                count += 1
-                logger.debug(f"Удален лог: {item}")
+    def stale_logs():
+        with os.scandir(log_dir) as it:
+            for entry in it:
+                if ".log" not in entry.name or not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat()
+                if st.st_mtime < cutoff:
+                    yield entry.path, st.st_size
+    
+    count, size = _unlink_parallel(stale_logs(), "лог")
     
     logger.info(f"Удалено {count} лог-файлов (всего {size / 1024 / 1024:.1f} MB)")
 
@@ -60,21 +106,31 @@ def cleanup_backups(backup_dir: str = "data/backup", keep_last: int = 5):
         return
     
     # Получаем список бэкапов, сортированных по времени создания
-    backups = [(f, f.stat().st_mtime) for f in backup_path.glob("*.zip")]
-    backups.sort(key=lambda x: x[1], reverse=True)
+    backups = [(f, f.stat()) for f in backup_path.glob("*.zip")]
+    backups.sort(key=lambda x: x[1].st_mtime, reverse=True)
     
     # Удаляем старые бэкапы
     if len(backups) > keep_last:
-        count = 0
-        size = 0
-        for f, _ in backups[keep_last:]:
-            size += f.stat().st_size
-            f.unlink()
-            count += 1
-            logger.debug(f"Удален бэкап: {f}")
+        count, size = _unlink_parallel(
+            ((str(f), st.st_size) for f, st in backups[keep_last:]), "бэкап"
+        )
         
         logger.info(f"Удалено {count} бэкапов (всего {size / 1024 / 1024:.1f} MB)")
 
+def cleanup_pdf_cache(cache_dir: str = os.path.join(tempfile.gettempdir(), "invoice_pdf_cache")):
+    """Очистка кэша растеризованных PDF"""
+    if not os.path.isdir(cache_dir):
+        return
+    
+    # Кэш может быть открыт GUI или API: записи удаляются через diskcache,
+    # под его блокировками, а файлы индекса SQLite остаются на месте
+    with diskcache.Cache(cache_dir) as cache:
+        volume = cache.volume()
+        count = cache.clear()
+        size = volume - cache.volume()
+    
+    logger.info(f"Удалено {count} записей кэша PDF (всего {size / 1024 / 1024:.1f} MB)")
+
 def main():
     """Основная функция"""
     try:
@@ -83,21 +139,23 @@ def main():
         cleanup_temp_files()
         cleanup_logs()
         cleanup_backups()
+        cleanup_pdf_cache()
         
         # Очищаем кэш Python
-        cache_dirs = ["__pycache__", ".pytest_cache", ".mypy_cache"]
+        cache_dirs = {"__pycache__", ".pytest_cache", ".mypy_cache"}
+        skip_dirs = {".git", "venv", ".venv", ".tox", "node_modules"}
         count = 0
         size = 0
         
-        for cache_dir in cache_dirs:
-            for root, dirs, files in os.walk("."):
-                if cache_dir in dirs:
-                    cache_path = Path(root) / cache_dir
-                    cache_size = sum(f.stat().st_size for f in cache_path.glob("**/*") if f.is_file())
-                    shutil.rmtree(cache_path)
-                    count += 1
-                    size += cache_size
-                    logger.debug(f"Удален кэш: {cache_path}")
+        # Один проход по проекту: найденные кэши удаляем и не спускаемся
+        # в них, служебные директории пропускаем целиком
+        for root, dirs, files in os.walk("."):
+            for cache_dir in cache_dirs.intersection(dirs):
+                cache_path = Path(root) / cache_dir
+                size += _remove_tree(str(cache_path))
+                count += 1
+                logger.debug(f"Удален кэш: {cache_path}")
+            dirs[:] = [d for d in dirs if d not in cache_dirs and d not in skip_dirs]
         
         logger.info(f"Удалено {count} кэш-директорий (всего {size / 1024 / 1024:.1f} MB)")
         logger.info("Очистка завершена")
@@ -1,22 +1,70 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 import uvicorn
 from pathlib import Path
-import shutil
-import os
 from typing import Optional
 import json
+import asyncio
+import logging
+import uuid
 
-from ..models.invoice_processor import InvoiceProcessor
+from ..models.invoice_processor import get_processor, decode_image
+
+logger = logging.getLogger("API")
 
 app = FastAPI(title="Invoice Recognition API")
 
-# Создаем директорию для временных файлов
-UPLOAD_DIR = Path("temp_uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+def _load_processor():
+    """
+    Загрузка общего процессора и включение пакетного режима детектора:
+    одновременные запросы объединяются в один вызов модели, остальные
+    этапы процессор выполняет по одному
+    """
+    get_processor().detector.enable_batching()
+
+def _log_warm_up_error(future: asyncio.Future):
+    """Запись в лог ошибки загрузки моделей при запуске"""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Ошибка загрузки моделей: {str(future.exception())}")
+
+@app.on_event("startup")
+async def warm_up_processor():
+    """Загрузка моделей в фоне, не блокируя запуск API"""
+    future = asyncio.get_running_loop().run_in_executor(None, _load_processor)
+    future.add_done_callback(_log_warm_up_error)
 
-# Инициализация процессора счетов
-processor = InvoiceProcessor()
+def _process_upload(content: bytes, filename: str, visualize: bool):
+    """
+    Декодирование и обработка загруженного счета (блокирующий вызов)
+    
+    Args:
+        content: содержимое загруженного файла
+        filename: имя загруженного файла
+        visualize: флаг визуализации результатов
+        
+    Returns:
+        tuple: результаты обработки и структурированные данные
+    """
+    # Декодируем загруженный файл в памяти, без временного файла на диске;
+    # PDF растеризуется так же, как при обработке файлов с диска
+    _, image = decode_image(content, filename)
+    if image is None:
+        raise ValueError(f"Не удалось декодировать изображение: {filename}")
+        
+    processor = get_processor()
+    
+    # Обрабатываем счет
+    results = processor.process_invoice(
+        filename,
+        visualize=visualize,
+        image=image
+    )
+    
+    # Извлекаем структурированные данные
+    structured_data = processor.extract_structured_data(results)
+    
+    return results, structured_data
 
 @app.post("/process_invoice")
 async def process_invoice(
@@ -36,22 +84,18 @@ async def process_invoice(
         JSON с результатами распознавания
     """
     try:
-        # Сохраняем загруженный файл
-        file_path = UPLOAD_DIR / file.filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # Обрабатываем счет
-        results = processor.process_invoice(
-            str(file_path),
-            visualize=visualize
-        )
+        content = await file.read()
         
-        # Извлекаем структурированные данные
-        structured_data = processor.extract_structured_data(results)
+        # Имя от клиента используется только для именования результатов:
+        # отбрасываем путь и добавляем уникальный префикс, чтобы
+        # одновременные загрузки с одинаковым именем не перезаписывали друг друга
+        filename = f"{uuid.uuid4().hex[:8]}_{Path(file.filename or 'invoice').name}"
         
-        # Удаляем временный файл
-        os.remove(file_path)
+        # Распознавание выполняется в пуле потоков, чтобы не блокировать
+        # цикл событий на время работы моделей
+        results, structured_data = await run_in_threadpool(
+            _process_upload, content, filename, visualize
+        )
         
         return JSONResponse(content={
             "status": "success",
@@ -1,9 +1,14 @@
 import sys
+import asyncio
 from PySide6.QtWidgets import QApplication
+from qasync import QEventLoop
 from .main_window import MainWindow
 
 def main():
     app = QApplication(sys.argv)
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
     window = MainWindow()
     window.show()
-    sys.exit(app.exec()) 
\ No newline at end of file
+    with loop:
+        loop.run_forever() 
\ No newline at end of file
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 import sys
+import asyncio
 import logging
 from PySide6.QtWidgets import QApplication
+from qasync import QEventLoop
 from .main_window import MainWindow
 
 def setup_logging():
@@ -28,6 +30,10 @@ def main():
         app.setApplicationName("Invoice Recognition")
         app.setOrganizationName("InvoiceRecognition")
         
+        # Цикл asyncio поверх цикла Qt - для асинхронных обработчиков окна
+        loop = QEventLoop(app)
+        asyncio.set_event_loop(loop)
+        
         # Устанавливаем стиль
         app.setStyle("Fusion")
         
@@ -36,7 +42,8 @@ def main():
         window.show()
         
         # Запускаем цикл обработки событий
-        sys.exit(app.exec())
+        with loop:
+            loop.run_forever()
         
     except Exception as e:
         logger.error(f"Ошибка при запуске приложения: {e}", exc_info=True)
@@ -1,58 +1,424 @@
 import sys
 import os
+import asyncio
 from pathlib import Path
 from datetime import datetime
 import json
+import csv
 import logging
-from typing import Optional, List, Dict
+import gc
+import ctypes
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Optional, List, Dict, Tuple
+
+import cv2
+import numpy as np
+import orjson
+from qasync import asyncSlot
 
 from PySide6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel, 
     QPushButton, QFileDialog, QProgressBar, QTabWidget,
     QTableWidget, QTableWidgetItem, QComboBox, QSpinBox,
     QCheckBox, QMessageBox, QSplitter, QMenu, QStatusBar,
-    QDockWidget, QTextEdit, QTreeWidget, QTreeWidgetItem
+    QDockWidget, QPlainTextEdit, QTreeWidget, QTreeWidgetItem
 )
-from PySide6.QtCore import Qt, QThread, Signal, QTimer, QSettings
-from PySide6.QtGui import QAction, QIcon, QPixmap, QImage, QPainter
+from PySide6.QtCore import Qt, QObject, QThread, Signal, Slot, QTimer, QSettings, QSize
+from PySide6.QtGui import QAction, QIcon, QPixmap, QImage, QImageReader, QImageIOHandler, QPainter
 
-from ..models.invoice_processor import InvoiceProcessor
+from ..models.invoice_processor import get_processor
 from ..utils.config_manager import ConfigManager
 
 logger = logging.getLogger(__name__)
 
-class ProcessingThread(QThread):
-    """Поток для обработки счетов"""
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".pdf"}
+SCRIPTS_DIR = Path(__file__).resolve().parents[2] / "scripts"
+RESULT_COLUMNS = ("Файл", "Поле", "Значение", "Точность")
+# Число процессов-обработчиков по умолчанию: каждый загружает свои модели
+# YOLO и EasyOCR, поэтому их немного даже на многоядерных машинах
+DEFAULT_MAX_WORKERS = 4
+# Как часто поток обработки проверяет отмену, пока пакеты выполняются, с
+CANCEL_POLL_INTERVAL = 0.2
+# Качество чтения JPEG ниже 50: быстрый целочисленный DCT без сглаживания
+FAST_PREVIEW_QUALITY = 25
+
+# Таблица стилей темной темы
+DARK_STYLESHEET = """
+QMainWindow, QWidget {
+    background-color: #2b2b2b;
+    color: #ffffff;
+}
+QTableWidget {
+    gridline-color: #3d3d3d;
+    background-color: #2b2b2b;
+    color: #ffffff;
+}
+QHeaderView::section {
+    background-color: #3d3d3d;
+    color: #ffffff;
+}
+QPushButton {
+    background-color: #3d3d3d;
+    color: #ffffff;
+    border: 1px solid #505050;
+    padding: 5px;
+}
+QPushButton:hover {
+    background-color: #505050;
+}
+QComboBox, QSpinBox {
+    background-color: #3d3d3d;
+    color: #ffffff;
+    border: 1px solid #505050;
+}
+"""
+
+@lru_cache(maxsize=1)
+def _cuda_available() -> bool:
+    """
+    Наличие GPU с CUDA
+    
+    Проверяется через driver API (libcuda), чтобы не загружать torch
+    при создании окна; результат запоминается на время работы программы.
+    """
+    try:
+        lib = ctypes.CDLL("nvcuda.dll" if os.name == "nt" else "libcuda.so.1")
+    except OSError:
+        return False
+    count = ctypes.c_int()
+    if lib.cuInit(0) != 0 or lib.cuDeviceGetCount(ctypes.byref(count)) != 0:
+        return False
+    return count.value > 0
+
+def _iter_images(root: str):
+    """Обход директории за один проход через os.scandir, возвращает пути изображений"""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                    yield entry.path
+
+def _init_worker_process(settings: Dict):
+    """Инициализация процесса-обработчика: у каждого процесса свой процессор"""
+    get_processor().update_config(settings)
+
+def _process_batch_in_worker(files: List[str], batch_size: int, use_cache: bool, cancel_event) -> Dict:
+    """Обработка пакета файлов в процессе-обработчике"""
+    return get_processor().process_batch(files, batch_size, use_cache=use_cache,
+                                         cancel_event=cancel_event)
+
+class ProcessingWorker(QObject):
+    """
+    Обработчик счетов
+    
+    Живет в постоянном потоке обработки; запросы приходят через очередь
+    событий этого потока и выполняются по одному. Файлы внутри запроса
+    обрабатываются пулом: на GPU - одним потоком с общим процессором
+    (контекст CUDA нельзя разделить между процессами, а модели и OCR
+    процессора не потокобезопасны), на CPU - параллельно процессами.
+    """
     progress = Signal(int)
+    status = Signal(str)
     finished = Signal(dict)
     error = Signal(str)
     
-    def __init__(self, processor: InvoiceProcessor, files: List[str]):
+    def __init__(self):
         super().__init__()
-        self.processor = processor
-        self.files = files
-        
-    def run(self):
+        self.processor = None
+        self.cuda_stream = None
+        self.executor = None
+        self.executor_key = None
+        # Менеджер событий отмены, разделяемых с процессами-обработчиками
+        self.manager = None
+        
+    def _inference_context(self, device: str):
+        """
+        Контекст выполнения моделей
+        
+        Для GPU используется один CUDA stream на весь срок жизни потока,
+        поэтому контекст CUDA и выделенная память переиспользуются между запусками.
+        """
+        if device != "cuda":
+            return nullcontext()
+            
+        import torch
+        if not torch.cuda.is_available():
+            return nullcontext()
+            
+        if self.cuda_stream is None:
+            self.cuda_stream = torch.cuda.Stream()
+        return torch.cuda.stream(self.cuda_stream)
+        
+    def _process_batch(self, files: List[str], batch_size: int, use_cache: bool, cancel_event) -> Dict:
+        """Обработка пакета файлов в потоке пула общим процессором"""
+        with self._inference_context("cuda"):
+            return self.processor.process_batch(files, batch_size, use_cache=use_cache,
+                                                cancel_event=cancel_event)
+            
+    def _release_cuda_cache(self):
+        """
+        Освобождение кэша CUDA по окончании запуска
+        
+        Во время запуска кэш распределителя сохраняется, чтобы пакеты
+        переиспользовали уже выделенную память; после запуска память,
+        оставшаяся от EasyOCR, возвращается системе.
+        """
+        import torch
+        if torch.cuda.is_available():
+            gc.collect()
+            torch.cuda.empty_cache()
+            
+    def _get_executor(self, settings: Dict):
+        """
+        Пул обработки для текущих настроек
+        
+        Пул переиспользуется между запусками, пока не изменились настройки
+        моделей и число обработчиков, чтобы процессы-обработчики не загружали
+        модели заново; размер пакета и кэш на пул не влияют.
+        """
+        device = settings["model"]["device"]
+        num_workers = settings["processing"]["num_workers"]
+        key = json.dumps(
+            {"model": settings["model"], "ocr": settings["ocr"], "num_workers": num_workers},
+            sort_keys=True
+        )
+        if self.executor is not None and self.executor_key == key:
+            if self.processor is not None:
+                self.processor.update_config(settings)
+            return self.executor
+            
+        self.shutdown()
+        if device == "cuda":
+            # Модели загружаются в потоке обработки при первом запросе,
+            # чтобы окно отображалось сразу
+            if self.processor is None:
+                self.status.emit("Загрузка моделей...")
+                self.processor = get_processor()
+            self.processor.update_config(settings)
+            # Один поток: общий процессор вызывается только последовательно,
+            # параллелизм на GPU дает пакетная детекция внутри process_batch
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            # Процессы пула загружают модели в инициализаторе. spawn, а не
+            # fork: в процессе Qt уже работают потоки, и копия процесса
+            # с захваченными ими блокировками может зависнуть
+            self.status.emit("Загрузка моделей...")
+            self.executor = ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker_process,
+                initargs=(settings,)
+            )
+        self.executor_key = key
+        return self.executor
+        
+    def shutdown(self):
+        """Остановка пула обработки"""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+            self.executor_key = None
+        if self.manager is not None:
+            self.manager.shutdown()
+            self.manager = None
+            
+    @Slot(list, dict, object)
+    def process(self, files: List[str], settings: Dict, cancel_event: threading.Event):
+        """
+        Обработка списка файлов
+        
+        Отмена кооперативная: ещё не начатые пакеты снимаются с пула,
+        а выполняемые останавливаются перед следующим счетом - обработчики
+        проверяют общее с потоком событие отмены.
+        """
         try:
+            if cancel_event.is_set():
+                return
+                
+            executor = self._get_executor(settings)
+            if settings["model"]["device"] == "cuda":
+                task = self._process_batch
+                stop_event = cancel_event
+            else:
+                # Событие threading.Event не передается в другие процессы
+                task = _process_batch_in_worker
+                if self.manager is None:
+                    self.manager = multiprocessing.get_context("spawn").Manager()
+                stop_event = self.manager.Event()
+                
+            # Файлы отправляются в пул пакетами, чтобы детектор видел
+            # сразу несколько изображений за один вызов модели
+            batch_size = settings["processing"]["batch_size"]
+            use_cache = settings["processing"]["use_cache"]
+            chunks = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+            
             results = {}
-            for i, file in enumerate(self.files):
-                result = self.processor.process_file(file)
-                results[file] = result
-                self.progress.emit((i + 1) * 100 // len(self.files))
+            done = 0
+            futures = [executor.submit(task, chunk, batch_size, use_cache, stop_event) for chunk in chunks]
+            pending = set(futures)
+            while pending:
+                completed, pending = wait(pending, timeout=CANCEL_POLL_INTERVAL,
+                                          return_when=FIRST_COMPLETED)
+                if cancel_event.is_set():
+                    stop_event.set()
+                    for future in pending:
+                        future.cancel()
+                    return
+                for future in completed:
+                    chunk_results = future.result()
+                    results.update(chunk_results)
+                    done += len(chunk_results)
+                    self.progress.emit(done * 100 // len(files))
+                    self.status.emit(f"Обработано {done} из {len(files)}")
             self.finished.emit(results)
         except Exception as e:
             self.error.emit(str(e))
+        finally:
+            if settings["model"]["device"] == "cuda" and self.processor is not None:
+                self._release_cuda_cache()
+
+def _result_rows(results: Dict, prefix: str = "") -> List[Tuple[str, str, Optional[float]]]:
+    """
+    Строки таблицы результатов из структурированных данных счета
+    
+    Вложенные разделы (supplier) разворачиваются в поля "раздел.поле",
+    списки (items) показываются числом позиций. Точность есть только у
+    полей вида {"value": ..., "confidence": ...}, у остальных - None.
+    
+    Args:
+        results: структурированные данные счета
+        prefix: префикс имен полей вложенного раздела
+        
+    Returns:
+        List[Tuple[str, str, Optional[float]]]: (поле, значение, точность)
+    """
+    rows = []
+    for field, data in results.items():
+        name = f"{prefix}{field}"
+        if isinstance(data, dict) and "value" in data:
+            rows.append((name, str(data["value"]), data.get("confidence")))
+        elif isinstance(data, dict):
+            rows.extend(_result_rows(data, f"{name}."))
+        elif isinstance(data, list):
+            rows.append((name, f"{len(data)} поз.", None))
+        else:
+            rows.append((name, "" if data is None else str(data), None))
+    return rows
+
+def _cv_to_qimage(bgr: np.ndarray) -> QImage:
+    """Преобразование изображения OpenCV (BGR) в QImage без конвертации цвета"""
+    # Вырезанная область - не непрерывный view, его буфер Qt не примет
+    if not bgr.flags['C_CONTIGUOUS']:
+        bgr = np.ascontiguousarray(bgr)
+    h, w = bgr.shape[:2]
+    # copy() отвязывает QImage от памяти массива numpy, пока bgr еще жив
+    return QImage(bgr.data, w, h, bgr.strides[0], QImage.Format_BGR888).copy()
+
+class ImageLoadThread(QThread):
+    """Поток для загрузки изображения предпросмотра"""
+    loaded = Signal(str, QImage)
+    
+    def __init__(self, file_path: str, size: QSize, parent=None):
+        super().__init__(parent)
+        self.file_path = file_path
+        self.size = size
+        
+    def _read_scaled(self, size: QSize, quality: int) -> QImage:
+        """Чтение изображения сразу в размере size"""
+        reader = QImageReader(self.file_path)
+        reader.setAutoTransform(True)
+        reader.setQuality(quality)
+        reader.setScaledSize(size)
+        return reader.read()
+        
+    def run(self):
+        reader = QImageReader(self.file_path)
+        reader.setAutoTransform(True)
+        size = reader.size()
+        if size.isValid():
+            size.scale(self.size, Qt.KeepAspectRatio)
+            if reader.supportsOption(QImageIOHandler.ScaledSize):
+                # Декодируем сразу в размере виджета: для JPEG libjpeg уменьшает
+                # изображение при распаковке. Сначала показываем быстрое
+                # декодирование, затем заменяем его сглаженным
+                image = self._read_scaled(size, FAST_PREVIEW_QUALITY)
+                if not image.isNull():
+                    self.loaded.emit(self.file_path, image)
+                    image = self._read_scaled(size, 100)
+            else:
+                # Формат декодируется только целиком: один раз читаем файл
+                # и масштабируем сначала без фильтрации, затем со сглаживанием
+                image = reader.read()
+                if not image.isNull():
+                    self.loaded.emit(
+                        self.file_path,
+                        image.scaled(size, Qt.IgnoreAspectRatio, Qt.FastTransformation)
+                    )
+                    image = image.scaled(size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            if not image.isNull():
+                self.loaded.emit(self.file_path, image)
+                return
+                
+        # Формат не поддерживается Qt - декодируем через OpenCV
+        image = cv2.imread(self.file_path)
+        if image is None:
+            return
+            
+        # Масштабируем в numpy до размера виджета, чтобы QImage и QPixmap
+        # строились уже из уменьшенного изображения
+        h, w = image.shape[:2]
+        scale = min(self.size.width() / w, self.size.height() / h)
+        if scale > 0 and scale != 1:
+            image = cv2.resize(
+                image,
+                (max(1, int(w * scale)), max(1, int(h * scale))),
+                interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+            )
+            
+        self.loaded.emit(self.file_path, _cv_to_qimage(image))
 
 class MainWindow(QMainWindow):
+    processing_requested = Signal(list, dict, object)
+    
     def __init__(self):
         super().__init__()
         self.config = ConfigManager()
-        self.processor = InvoiceProcessor()
         self.current_results = {}
-        self.processing_thread = None
+        self.shown_file = None
+        self.is_processing = False
+        self.cancel_event = None
+        
+        # Предпросмотр загружается после паузы в смене выделения, чтобы
+        # при пролистывании списка стрелками не декодировать каждый файл
+        self.selection_timer = QTimer(self)
+        self.selection_timer.setSingleShot(True)
+        self.selection_timer.setInterval(100)
+        self.selection_timer.timeout.connect(self.show_selected_file)
         
         self.init_ui()
         self.load_settings()
+        self.init_processing()
+        
+    def init_processing(self):
+        """Запуск постоянного потока обработки"""
+        self.processing_thread = QThread(self)
+        self.worker = ProcessingWorker()
+        self.worker.moveToThread(self.processing_thread)
+        
+        self.processing_requested.connect(self.worker.process)
+        self.worker.progress.connect(self.progress_bar.setValue)
+        self.worker.status.connect(self.statusBar.showMessage)
+        self.worker.finished.connect(self.processing_finished)
+        self.worker.error.connect(self.processing_error)
+        
+        self.processing_thread.start()
         
     def init_ui(self):
         """Инициализация интерфейса"""
@@ -175,11 +541,33 @@ class MainWindow(QMainWindow):
         conf_layout.addWidget(self.conf_spin)
         settings_layout.addLayout(conf_layout)
         
+        # Размер пакета
+        batch_layout = QHBoxLayout()
+        batch_layout.addWidget(QLabel("Пакет:"))
+        self.batch_spin = QSpinBox()
+        self.batch_spin.setRange(1, 64)
+        self.batch_spin.setValue(8)
+        batch_layout.addWidget(self.batch_spin)
+        settings_layout.addLayout(batch_layout)
+        
         # Использование GPU
         self.gpu_check = QCheckBox("Использовать GPU")
-        self.gpu_check.setChecked(torch.cuda.is_available())
+        self.gpu_check.setChecked(_cuda_available())
         settings_layout.addWidget(self.gpu_check)
         
+        # Точность вычислений на GPU
+        precision_layout = QHBoxLayout()
+        precision_layout.addWidget(QLabel("Точность вычислений:"))
+        self.precision_combo = QComboBox()
+        self.precision_combo.addItems(["FP32", "FP16", "BF16"])
+        precision_layout.addWidget(self.precision_combo)
+        settings_layout.addLayout(precision_layout)
+        
+        # Кэш результатов
+        self.cache_check = QCheckBox("Использовать кэш результатов")
+        self.cache_check.setChecked(True)
+        settings_layout.addWidget(self.cache_check)
+        
         layout.addWidget(settings_group)
         
     def create_center_panel(self, layout):
@@ -253,14 +641,15 @@ class MainWindow(QMainWindow):
         
     def create_log_dock(self):
         """Создание дока для логов"""
-        dock = QDockWidget("Логи", self)
-        dock.setAllowedAreas(Qt.BottomDockWidgetArea)
+        self.log_dock = QDockWidget("Логи", self)
+        self.log_dock.setAllowedAreas(Qt.BottomDockWidgetArea)
         
-        self.log_text = QTextEdit()
+        # Простой текст без разбора разметки и пересчета rich-text документа
+        self.log_text = QPlainTextEdit()
         self.log_text.setReadOnly(True)
-        dock.setWidget(self.log_text)
+        self.log_dock.setWidget(self.log_text)
         
-        self.addDockWidget(Qt.BottomDockWidgetArea, dock)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.log_dock)
         
     def create_menu(self):
         """Создание главного меню"""
@@ -347,7 +736,8 @@ class MainWindow(QMainWindow):
         if files:
             self.add_files(files)
             
-    def open_directory(self):
+    @asyncSlot()
+    async def open_directory(self):
         """Открытие директории для обработки"""
         directory = QFileDialog.getExistingDirectory(
             self,
@@ -355,20 +745,33 @@ class MainWindow(QMainWindow):
             ""
         )
         if directory:
-            files = []
-            for ext in [".jpg", ".jpeg", ".png", ".pdf"]:
-                files.extend(Path(directory).glob(f"**/*{ext}"))
-            self.add_files([str(f) for f in files])
+            loop = asyncio.get_running_loop()
+            files = await loop.run_in_executor(None, lambda: sorted(_iter_images(directory)))
+            self.add_files(files)
             
     def add_files(self, files: List[str]):
         """Добавление файлов в дерево"""
+        # Элементы создаются без родителя и добавляются одним вызовом,
+        # чтобы дерево перерисовалось один раз, а не на каждый файл
+        items = []
         for file in files:
-            item = QTreeWidgetItem(self.file_tree)
+            item = QTreeWidgetItem()
             item.setText(0, os.path.basename(file))
             item.setData(0, Qt.UserRole, file)
+            items.append(item)
+            
+        self.file_tree.setUpdatesEnabled(False)
+        try:
+            self.file_tree.addTopLevelItems(items)
+        finally:
+            self.file_tree.setUpdatesEnabled(True)
             
     def file_selected(self):
         """Обработка выбора файла"""
+        self.selection_timer.start()
+        
+    def show_selected_file(self):
+        """Отображение выбранного файла"""
         items = self.file_tree.selectedItems()
         if items:
             file_path = items[0].data(0, Qt.UserRole)
@@ -376,33 +779,41 @@ class MainWindow(QMainWindow):
             
     def show_file(self, file_path: str):
         """Отображение файла"""
-        # Показываем изображение
-        pixmap = QPixmap(file_path)
-        if not pixmap.isNull():
-            scaled = pixmap.scaled(
-                self.image_view.size(),
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-            self.image_view.setPixmap(scaled)
+        # Загружаем изображение в фоновом потоке, чтобы не блокировать интерфейс
+        self.shown_file = file_path
+        loader = ImageLoadThread(file_path, self.image_view.size(), self)
+        loader.loaded.connect(self.image_loaded)
+        loader.finished.connect(loader.deleteLater)
+        loader.start()
             
         # Показываем результаты, если есть
         if file_path in self.current_results:
             self.show_results(self.current_results[file_path])
             
+    def image_loaded(self, file_path: str, image: QImage):
+        """Изображение загружено"""
+        # Результат устаревшей загрузки игнорируем
+        if file_path == self.shown_file:
+            self.image_view.setPixmap(QPixmap.fromImage(image))
+            
     def show_results(self, results: Dict):
         """Отображение результатов распознавания"""
-        self.result_table.setRowCount(0)
-        for field, data in results.items():
-            row = self.result_table.rowCount()
-            self.result_table.insertRow(row)
-            self.result_table.setItem(row, 0, QTableWidgetItem(field))
-            self.result_table.setItem(row, 1, QTableWidgetItem(str(data["value"])))
-            self.result_table.setItem(row, 2, QTableWidgetItem(f"{data['confidence']:.2%}"))
+        rows = _result_rows(results)
+        self.result_table.setUpdatesEnabled(False)
+        try:
+            self.result_table.setRowCount(len(rows))
+            for row, (field, value, confidence) in enumerate(rows):
+                self.result_table.setItem(row, 0, QTableWidgetItem(field))
+                self.result_table.setItem(row, 1, QTableWidgetItem(value))
+                self.result_table.setItem(
+                    row, 2, QTableWidgetItem(f"{confidence:.2%}" if confidence is not None else "—")
+                )
+        finally:
+            self.result_table.setUpdatesEnabled(True)
             
     def start_processing(self):
         """Запуск обработки файлов"""
-        if self.processing_thread and self.processing_thread.isRunning():
+        if self.is_processing:
             return
             
         files = []
@@ -414,35 +825,47 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Ошибка", "Нет файлов для обработки")
             return
             
-        # Обновляем настройки процессора
-        self.processor.config.update({
+        # Количество параллельных обработчиков
+        processing_config = (self.config.get_config("default") or {}).get("processing", {})
+        num_workers = processing_config.get("num_workers") or min(
+            DEFAULT_MAX_WORKERS, max(1, (os.cpu_count() or 2) - 1)
+        )
+        
+        # Настройки процессора
+        settings = {
             "model": {
                 "name": self.model_combo.currentText(),
                 "confidence_threshold": self.conf_spin.value() / 100,
-                "device": "cuda" if self.gpu_check.isChecked() else "cpu"
+                "device": "cuda" if self.gpu_check.isChecked() else "cpu",
+                "precision": self.precision_combo.currentText().lower()
             },
             "ocr": {
                 "engine": self.ocr_combo.currentText()
+            },
+            "processing": {
+                "num_workers": num_workers,
+                "batch_size": self.batch_spin.value(),
+                "use_cache": self.cache_check.isChecked()
             }
-        })
+        }
         
         # Запускаем обработку
-        self.processing_thread = ProcessingThread(self.processor, files)
-        self.processing_thread.progress.connect(self.progress_bar.setValue)
-        self.processing_thread.finished.connect(self.processing_finished)
-        self.processing_thread.error.connect(self.processing_error)
-        self.processing_thread.start()
+        self.is_processing = True
+        self.cancel_event = threading.Event()
+        self.processing_requested.emit(files, settings, self.cancel_event)
         
         self.statusBar.showMessage("Обработка...")
         
     def stop_processing(self):
         """Остановка обработки"""
-        if self.processing_thread and self.processing_thread.isRunning():
-            self.processing_thread.terminate()
+        if self.is_processing:
+            self.cancel_event.set()
+            self.is_processing = False
             self.statusBar.showMessage("Обработка остановлена")
             
     def processing_finished(self, results: Dict):
         """Обработка завершена"""
+        self.is_processing = False
         self.current_results.update(results)
         self.statusBar.showMessage("Обработка завершена")
         
@@ -452,40 +875,52 @@ class MainWindow(QMainWindow):
         # Показываем результаты текущего файла
         items = self.file_tree.selectedItems()
         if items:
-            self.show_results(results[items[0].data(0, Qt.UserRole)])
+            file_results = results.get(items[0].data(0, Qt.UserRole))
+            if file_results is not None:
+                self.show_results(file_results)
             
     def processing_error(self, error: str):
         """Ошибка обработки"""
+        self.is_processing = False
         QMessageBox.critical(self, "Ошибка", f"Ошибка при обработке: {error}")
         self.statusBar.showMessage("Ошибка обработки")
         
     def update_statistics(self, results: Dict):
         """Обновление статистики"""
-        total_confidence = 0
-        field_stats = {}
-        
+        # Один проход: номер поля (в порядке появления) и точность
+        field_index = {}
+        field_ids = []
+        confidences = []
         for file_results in results.values():
-            for field, data in file_results.items():
-                if field not in field_stats:
-                    field_stats[field] = {"total": 0, "count": 0}
-                field_stats[field]["total"] += data["confidence"]
-                field_stats[field]["count"] += 1
-                total_confidence += data["confidence"]
+            for field, _, confidence in _result_rows(file_results):
+                # Поля без оценки точности в статистику не входят
+                if confidence is None:
+                    continue
+                field_ids.append(field_index.setdefault(field, len(field_index)))
+                confidences.append(confidence)
                 
+        if not confidences:
+            return
+            
+        confidences = np.asarray(confidences, dtype=np.float64)
+        field_ids = np.asarray(field_ids)
+        avgs = np.bincount(field_ids, weights=confidences) / np.bincount(field_ids)
+        
         # Обновляем общую точность
-        avg_confidence = total_confidence / sum(len(r) for r in results.values())
-        self.accuracy_label.setText(f"Точность: {avg_confidence:.2%}")
+        self.accuracy_label.setText(f"Точность: {confidences.mean():.2%}")
         
         # Обновляем статистику по полям
-        self.field_stats.setRowCount(0)
-        for field, stats in field_stats.items():
-            row = self.field_stats.rowCount()
-            self.field_stats.insertRow(row)
-            self.field_stats.setItem(row, 0, QTableWidgetItem(field))
-            avg = stats["total"] / stats["count"]
-            self.field_stats.setItem(row, 1, QTableWidgetItem(f"{avg:.2%}"))
-            
-    def export_results(self):
+        self.field_stats.setUpdatesEnabled(False)
+        try:
+            self.field_stats.setRowCount(len(field_index))
+            for row, (field, avg) in enumerate(zip(field_index, avgs)):
+                self.field_stats.setItem(row, 0, QTableWidgetItem(field))
+                self.field_stats.setItem(row, 1, QTableWidgetItem(f"{avg:.2%}"))
+        finally:
+            self.field_stats.setUpdatesEnabled(True)
+            
+    @asyncSlot()
+    async def export_results(self):
         """Экспорт результатов"""
         if not self.current_results:
             QMessageBox.warning(self, "Ошибка", "Нет результатов для экспорта")
@@ -500,20 +935,60 @@ class MainWindow(QMainWindow):
         
         if file_path:
             try:
-                ext = os.path.splitext(file_path)[1]
-                if ext == ".json":
-                    with open(file_path, "w", encoding="utf-8") as f:
-                        json.dump(self.current_results, f, ensure_ascii=False, indent=2)
-                elif ext == ".xlsx":
-                    self.export_to_excel(file_path)
-                elif ext == ".csv":
-                    self.export_to_csv(file_path)
-                    
+                # Запись файла выполняется в пуле, окно продолжает отрисовываться
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._write_results, file_path
+                )
                 self.statusBar.showMessage(f"Результаты сохранены в {file_path}")
                 
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Ошибка при сохранении: {e}")
                 
+    def _write_results(self, file_path: str):
+        """Запись результатов в файл по расширению"""
+        ext = os.path.splitext(file_path)[1]
+        if ext == ".json":
+            with open(file_path, "wb") as f:
+                f.write(orjson.dumps(
+                    self.current_results,
+                    option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+                ))
+        elif ext == ".xlsx":
+            self.export_to_excel(file_path)
+        elif ext == ".csv":
+            self.export_to_csv(file_path)
+            
+    def _result_rows(self) -> List[tuple]:
+        """Результаты в виде строк (файл, поле, значение, точность)"""
+        rows = []
+        for file_path, file_results in self.current_results.items():
+            for field, data in file_results.items():
+                if isinstance(data, dict):
+                    rows.append((file_path, field, data.get("value"), data.get("confidence")))
+                else:
+                    rows.append((file_path, field, data, None))
+        return rows
+        
+    def export_to_csv(self, file_path: str):
+        """Экспорт результатов в CSV"""
+        with open(file_path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(RESULT_COLUMNS)
+            writer.writerows(self._result_rows())
+            
+    def export_to_excel(self, file_path: str):
+        """Экспорт результатов в Excel"""
+        from openpyxl import Workbook
+        
+        # Книга в режиме write_only пишет строки потоком, не держа лист в памяти
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Результаты")
+        sheet.append(RESULT_COLUMNS)
+        for row in self._result_rows():
+            sheet.append([cell if isinstance(cell, (str, int, float, type(None))) else str(cell)
+                          for cell in row])
+        workbook.save(file_path)
+        
     def load_settings(self):
         """Загрузка настроек"""
         settings = QSettings("InvoiceRecognition", "GUI")
@@ -529,70 +1004,70 @@ class MainWindow(QMainWindow):
         self.conf_spin.setValue(int(settings.value("confidence", 80)))
         self.gpu_check.setChecked(settings.value("use_gpu", True, type=bool))
         
+        # Запоминаем загруженное состояние, чтобы при сохранении
+        # записывать только изменившиеся значения
+        self.loaded_settings = self.current_settings()
+        
+    def current_settings(self) -> Dict:
+        """Текущие значения сохраняемых настроек"""
+        return {
+            "geometry": self.saveGeometry(),
+            "model": self.model_combo.currentText(),
+            "ocr": self.ocr_combo.currentText(),
+            "confidence": self.conf_spin.value(),
+            "use_gpu": self.gpu_check.isChecked()
+        }
+        
     def save_settings(self):
         """Сохранение настроек"""
         settings = QSettings("InvoiceRecognition", "GUI")
         
-        settings.setValue("geometry", self.saveGeometry())
-        settings.setValue("model", self.model_combo.currentText())
-        settings.setValue("ocr", self.ocr_combo.currentText())
-        settings.setValue("confidence", self.conf_spin.value())
-        settings.setValue("use_gpu", self.gpu_check.isChecked())
+        for key, value in self.current_settings().items():
+            if self.loaded_settings.get(key) != value:
+                settings.setValue(key, value)
+        settings.sync()
         
     def closeEvent(self, event):
         """Обработка закрытия окна"""
         self.save_settings()
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+        self.processing_thread.quit()
+        self.processing_thread.wait()
+        self.worker.shutdown()
         event.accept()
         
     def set_theme(self, theme: str):
         """Установка темы оформления"""
-        if theme == "dark":
-            # Применяем темную тему
-            self.setStyleSheet("""
-                QMainWindow, QWidget {
-                    background-color: #2b2b2b;
-                    color: #ffffff;
-                }
-                QTableWidget {
-                    gridline-color: #3d3d3d;
-                    background-color: #2b2b2b;
-                    color: #ffffff;
-                }
-                QHeaderView::section {
-                    background-color: #3d3d3d;
-                    color: #ffffff;
-                }
-                QPushButton {
-                    background-color: #3d3d3d;
-                    color: #ffffff;
-                    border: 1px solid #505050;
-                    padding: 5px;
-                }
-                QPushButton:hover {
-                    background-color: #505050;
-                }
-                QComboBox, QSpinBox {
-                    background-color: #3d3d3d;
-                    color: #ffffff;
-                    border: 1px solid #505050;
-                }
-            """)
-        else:
-            # Сбрасываем на светлую тему
-            self.setStyleSheet("")
+        stylesheet = DARK_STYLESHEET if theme == "dark" else ""
+        # Повторная установка той же таблицы стилей запускает полный разбор QSS
+        if self.styleSheet() != stylesheet:
+            self.setStyleSheet(stylesheet)
             
     def toggle_logs(self, show: bool):
         """Показать/скрыть панель логов"""
-        for dock in self.findChildren(QDockWidget):
-            if dock.windowTitle() == "Логи":
-                dock.setVisible(show)
+        self.log_dock.setVisible(show)
                 
     def show_settings(self):
         """Показ окна настроек"""
         # TODO: Реализовать окно настроек
         pass
         
-    def run_cleanup(self):
+    async def _run_script(self, name: str):
+        """Запуск скрипта из scripts/ отдельным процессом"""
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, str(SCRIPTS_DIR / f"{name}.py"),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT
+        )
+        output, _ = await process.communicate()
+        if output:
+            logger.info(output.decode(errors="replace"))
+        if process.returncode != 0:
+            raise RuntimeError(f"{name}.py завершился с кодом {process.returncode}")
+            
+    @asyncSlot()
+    async def run_cleanup(self):
         """Запуск очистки временных файлов"""
         reply = QMessageBox.question(
             self,
@@ -603,17 +1078,16 @@ class MainWindow(QMainWindow):
         
         if reply == QMessageBox.Yes:
             try:
-                from scripts.cleanup import main as cleanup_main
-                cleanup_main()
+                await self._run_script("cleanup")
                 self.statusBar.showMessage("Очистка выполнена")
             except Exception as e:
                 QMessageBox.critical(self, "Ошибка", f"Ошибка при очистке: {e}")
                 
-    def check_system(self):
+    @asyncSlot()
+    async def check_system(self):
         """Запуск проверки системы"""
         try:
-            from scripts.check_system import main as check_main
-            check_main()
+            await self._run_script("check_system")
             self.statusBar.showMessage("Проверка системы выполнена")
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Ошибка при проверке: {e}")
@@ -1,13 +1,66 @@
 import logging
 from typing import Dict, Any, Optional, Union, List
 from pathlib import Path
-import json
 import yaml
 import os
+import mmap
 from datetime import datetime
 
+import orjson
+
 logger = logging.getLogger("ConfigManager")
 
+def _positive(value: Any) -> bool:
+    return value >= 1
+
+def _not_empty(value: Any) -> bool:
+    return bool(value)
+
+# Таблица проверок validate_config, собирается один раз при импорте
+REQUIRED_SECTIONS = ("model", "processing", "storage")
+
+# (раздел, ключ, описание) путей, которые должны существовать
+REQUIRED_PATHS = (
+    ("model", "yolo_model_path", "Модель YOLO не найдена"),
+    ("model", "ocr_model_path", "Модель OCR не найдена"),
+)
+
+# (раздел, ключ, проверка, сообщение об ошибке)
+VALUE_CHECKS = (
+    ("processing", "batch_size", _positive, "Размер батча должен быть больше 0"),
+    ("processing", "num_workers", _positive, "Количество workers должно быть больше 0"),
+    ("storage", "max_file_size", _positive, "Максимальный размер файла должен быть больше 0"),
+    ("storage", "allowed_extensions", _not_empty, "Список разрешенных расширений пуст"),
+)
+
+# Директории хранения, создаваемые при валидации
+STORAGE_DIRS = ("input_dir", "output_dir", "temp_dir")
+
+# Пустая конфигурация для чтения значений отсутствующих конфигураций
+_EMPTY: Dict[str, Any] = {}
+
+# Файлы больше этого размера разбираются через mmap без промежуточной копии
+MMAP_THRESHOLD = 64 * 1024
+
+def _read_json(path: Union[str, Path]) -> Any:
+    """
+    Чтение JSON-файла
+    
+    Большие файлы отображаются в память и передаются orjson напрямую;
+    у маленьких стоимость mmap выше, и они читаются целиком.
+    
+    Args:
+        path: путь к файлу
+        
+    Returns:
+        Any: разобранные данные
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size <= MMAP_THRESHOLD:
+            return orjson.loads(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return orjson.loads(memoryview(mm))
+
 class ConfigManager:
     def __init__(self, config_dir: Union[str, Path] = "config"):
         """
@@ -19,28 +72,45 @@ class ConfigManager:
         self.config_dir = Path(config_dir)
         self.config_dir.mkdir(parents=True, exist_ok=True)
         
-        # Загружаем конфигурацию
+        # Конфигурации загружаются при первом обращении
         self.config: Dict[str, Any] = {}
-        self._load_config()
+        # Время изменения загруженных файлов, по нему перечитываются только измененные
+        self.mtimes: Dict[str, int] = {}
         
         logger.info("Инициализирован менеджер конфигурации")
         
     def _load_config(self) -> None:
         """
         Загрузка конфигурации из файлов
+        
+        Перечитываются только файлы, время изменения которых отличается
+        от запомненного; конфигурации удаленных файлов убираются.
         """
         try:
-            # Очищаем конфигурацию
-            self.config.clear()
-            
-            # Загружаем конфигурацию из файлов
-            for config_file in self.config_dir.glob("*.json"):
+            # Один проход по директории: scandir возвращает stat вместе с записью
+            with os.scandir(self.config_dir) as it:
+                entries = {
+                    entry.name[:-len(".json")]: (entry.path, entry.stat().st_mtime_ns)
+                    for entry in it
+                    if entry.name.endswith(".json") and entry.is_file()
+                }
+                
+            # Удаляем конфигурации, файлы которых удалены
+            for config_name in self.mtimes.keys() - entries.keys():
+                self.config.pop(config_name, None)
+                del self.mtimes[config_name]
+                
+            # Загружаем новые и измененные файлы
+            for config_name, (config_file, mtime) in entries.items():
+                if self.mtimes.get(config_name) == mtime:
+                    continue
+                    
                 try:
-                    with open(config_file, "r", encoding="utf-8") as f:
-                        config_data = json.load(f)
-                        
+                    config_data = _read_json(config_file)
+                    
                     # Добавляем конфигурацию
-                    self.config[config_file.stem] = config_data
+                    self.config[config_name] = config_data
+                    self.mtimes[config_name] = mtime
                     
                 except Exception as e:
                     logger.error(f"Ошибка загрузки конфигурации из {config_file}: {str(e)}")
@@ -48,6 +118,12 @@ class ConfigManager:
         except Exception as e:
             logger.error(f"Ошибка загрузки конфигурации: {str(e)}")
             
+    def reload(self) -> None:
+        """
+        Загрузка всех новых и измененных файлов конфигурации
+        """
+        self._load_config()
+            
     def _save_config(self, config_name: str) -> bool:
         """
         Сохранение конфигурации в файл
@@ -63,8 +139,12 @@ class ConfigManager:
             config_file = self.config_dir / f"{config_name}.json"
             
             # Сохраняем конфигурацию
-            with open(config_file, "w", encoding="utf-8") as f:
-                json.dump(self.config[config_name], f, ensure_ascii=False, indent=2)
+            with open(config_file, "wb") as f:
+                f.write(orjson.dumps(
+                    self.config[config_name],
+                    option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+                ))
+            self.mtimes[config_name] = config_file.stat().st_mtime_ns
                 
             return True
             
@@ -82,12 +162,26 @@ class ConfigManager:
         Returns:
             Optional[Dict[str, Any]]: конфигурация
         """
+        config_file = self.config_dir / f"{config_name}.json"
         try:
-            return self.config.get(config_name)
+            try:
+                mtime = config_file.stat().st_mtime_ns
+            except FileNotFoundError:
+                # Файл удален - забываем загруженную из него конфигурацию
+                if self.mtimes.pop(config_name, None) is not None:
+                    self.config.pop(config_name, None)
+                return self.config.get(config_name)
+                
+            # Файл разбирается только при первом обращении и после изменения
+            if self.mtimes.get(config_name) != mtime:
+                self.config[config_name] = _read_json(config_file)
+                self.mtimes[config_name] = mtime
+                
+            return self.config[config_name]
             
-        except Exception as e:
+        except (OSError, orjson.JSONDecodeError) as e:
             logger.error(f"Ошибка получения конфигурации {config_name}: {str(e)}")
-            return None
+            return self.config.get(config_name)
             
     def set_config(self, config_name: str, config_data: Dict[str, Any]) -> bool:
         """
@@ -130,6 +224,7 @@ class ConfigManager:
             # Удаляем конфигурацию
             if config_name in self.config:
                 del self.config[config_name]
+            self.mtimes.pop(config_name, None)
                 
             return True
             
@@ -145,9 +240,17 @@ class ConfigManager:
             List[str]: список конфигураций
         """
         try:
-            return list(self.config.keys())
+            with os.scandir(self.config_dir) as it:
+                names = {
+                    entry.name[:-len(".json")]
+                    for entry in it
+                    if entry.name.endswith(".json") and entry.is_file()
+                }
+            # Конфигурации без файла (не сохраненные) тоже входят в список
+            names.update(self.config.keys() - self.mtimes.keys())
+            return sorted(names)
             
-        except Exception as e:
+        except OSError as e:
             logger.error(f"Ошибка получения списка конфигураций: {str(e)}")
             return []
             
@@ -163,18 +266,7 @@ class ConfigManager:
         Returns:
             Any: значение
         """
-        try:
-            # Получаем конфигурацию
-            config = self.get_config(config_name)
-            if config is None:
-                return default
-                
-            # Получаем значение
-            return config.get(key, default)
-            
-        except Exception as e:
-            logger.error(f"Ошибка получения значения конфигурации {config_name}.{key}: {str(e)}")
-            return default
+        return (self.get_config(config_name) or _EMPTY).get(key, default)
             
     def set_config_value(self, config_name: str, key: str, value: Any) -> bool:
         """
@@ -185,23 +277,37 @@ class ConfigManager:
             key: ключ
             value: значение
             
+        Returns:
+            bool: успешность установки
+        """
+        return self.update_config_values(config_name, {key: value})
+        
+    def update_config_values(self, config_name: str, updates: Dict[str, Any]) -> bool:
+        """
+        Установка нескольких значений конфигурации
+        
+        Все значения применяются, после чего файл записывается один раз;
+        для массовых изменений предпочтительнее вызовов set_config_value
+        по одному ключу.
+        
+        Args:
+            config_name: название конфигурации
+            updates: ключи и значения
+            
         Returns:
             bool: успешность установки
         """
         try:
-            # Получаем конфигурацию
-            config = self.get_config(config_name)
-            if config is None:
-                config = {}
-                
-            # Устанавливаем значение
-            config[key] = value
+            # Файл перечитывается, если изменился, затем значения
+            # пишутся прямо в загруженный словарь
+            self.get_config(config_name)
+            self.config.setdefault(config_name, {}).update(updates)
             
             # Сохраняем конфигурацию
-            return self.set_config(config_name, config)
+            return self._save_config(config_name)
             
         except Exception as e:
-            logger.error(f"Ошибка установки значения конфигурации {config_name}.{key}: {str(e)}")
+            logger.error(f"Ошибка установки значений конфигурации {config_name}: {str(e)}")
             return False
             
     def validate_config(self) -> bool:
@@ -213,45 +319,30 @@ class ConfigManager:
         """
         try:
             # Проверяем обязательные разделы
-            required_sections = ["model", "processing", "storage"]
-            for section in required_sections:
-                if section not in self.config:
+            sections = {section: self.get_config(section) for section in REQUIRED_SECTIONS}
+            for section, section_config in sections.items():
+                if section_config is None:
                     logger.error(f"Отсутствует раздел {section}")
                     return False
                     
-            # Проверяем модель
-            model_config = self.config["model"]
-            if not Path(model_config["yolo_model_path"]).exists():
-                logger.error(f"Модель YOLO не найдена: {model_config['yolo_model_path']}")
-                return False
-                
-            if not Path(model_config["ocr_model_path"]).exists():
-                logger.error(f"Модель OCR не найдена: {model_config['ocr_model_path']}")
-                return False
-                
-            # Проверяем обработку
-            processing_config = self.config["processing"]
-            if processing_config["batch_size"] < 1:
-                logger.error("Размер батча должен быть больше 0")
-                return False
-                
-            if processing_config["num_workers"] < 1:
-                logger.error("Количество workers должно быть больше 0")
-                return False
-                
-            # Проверяем хранение
-            storage_config = self.config["storage"]
-            for dir_path in [storage_config["input_dir"], storage_config["output_dir"], storage_config["temp_dir"]]:
+            # Проверяем пути моделей
+            for section, key, message in REQUIRED_PATHS:
+                path = sections[section][key]
+                if not os.path.exists(path):
+                    logger.error(f"{message}: {path}")
+                    return False
+                    
+            # Проверяем значения
+            for section, key, check, message in VALUE_CHECKS:
+                if not check(sections[section][key]):
+                    logger.error(message)
+                    return False
+                    
+            # Создаем директории хранения (совпадающие пути - один раз)
+            storage_config = sections["storage"]
+            for dir_path in {storage_config[key] for key in STORAGE_DIRS}:
                 Path(dir_path).mkdir(parents=True, exist_ok=True)
                 
-            if storage_config["max_file_size"] < 1:
-                logger.error("Максимальный размер файла должен быть больше 0")
-                return False
-                
-            if not storage_config["allowed_extensions"]:
-                logger.error("Список разрешенных расширений пуст")
-                return False
-                
             return True
             
         except Exception as e:
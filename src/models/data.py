@@ -1,13 +1,45 @@
 import logging
+import sys
 from typing import Dict, Any, Optional, List, Union
 from pathlib import Path
-import json
+import os
+import mmap
 import time
-from dataclasses import dataclass, asdict
+import atexit
+import itertools
+import threading
+import weakref
+from operator import attrgetter
+from dataclasses import dataclass
+
+import orjson
 
 logger = logging.getLogger("Data")
 
-@dataclass
+# Журнал записей: по строке JSON на каждое изменение, последняя запись
+# для идентификатора актуальна
+LOG_FILE = "data.log"
+# Журнал сжимается, когда в нем больше COMPACT_RATIO записей на живую
+# запись (но не раньше COMPACT_MIN_RECORDS строк)
+COMPACT_RATIO = 2
+COMPACT_MIN_RECORDS = 1000
+# Обновления накапливаются и пишутся одной порцией через FLUSH_INTERVAL
+# секунд или сразу, когда набралось FLUSH_MAX_DIRTY измененных записей
+FLUSH_INTERVAL = 0.25
+FLUSH_MAX_DIRTY = 1000
+# Файлы больше этого размера разбираются через mmap без промежуточной копии
+MMAP_THRESHOLD = 64 * 1024
+
+def _close_at_exit(close_ref: weakref.WeakMethod) -> None:
+    """Закрытие менеджера при выходе, если он еще существует"""
+    close = close_ref()
+    if close is not None:
+        close()
+
+# На Python 3.10+ записи хранятся в слотах, без __dict__ на каждый экземпляр
+DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**DATACLASS_SLOTS)
 class DataInfo:
     id: str
     type: str
@@ -18,35 +50,155 @@ class DataInfo:
     status: str
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Запись для журнала
+        
+        В отличие от dataclasses.asdict, metadata и result не копируются
+        глубоко: словарь сразу сериализуется и отбрасывается.
+        """
+        return {
+            "id": self.id,
+            "type": self.type,
+            "path": self.path,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "metadata": self.metadata,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error
+        }
 
 class Data:
-    def __init__(self, data_dir: Union[str, Path] = "data/data"):
+    def __init__(self, data_dir: Union[str, Path] = "data/data", fsync: bool = False):
         """
         Инициализация менеджера данных
         
         Args:
             data_dir: директория для хранения данных
+            fsync: сбрасывать журнал на диск после каждой записи
         """
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(parents=True, exist_ok=True)
+        self.log_path = self.data_dir / LOG_FILE
+        self.fsync = fsync
         
         self.data: Dict[str, DataInfo] = {}
+        self.log_records = 0
+        
+        # Индексы идентификаторов по типу и статусу
+        self.by_type: Dict[str, set] = {}
+        self.by_status: Dict[str, set] = {}
+        
+        # Измененные, но еще не записанные данные
+        self.lock = threading.RLock()
+        self.dirty: set = set()
+        self.flush_timer: Optional[threading.Timer] = None
         
         # Загружаем данные
-        self._load_data()
+        if self.log_path.exists():
+            self._load_data()
+        else:
+            self._load_legacy_data()
+            self.compact()
+        for data_info in self.data.values():
+            self._index_add(data_info)
+            
+        self.log = open(self.log_path, "ab", buffering=1 << 20)
+        # Слабая ссылка: регистрация в atexit не удерживает менеджер в памяти
+        atexit.register(_close_at_exit, weakref.WeakMethod(self.close))
+        
+        # Идентификаторы: монотонный счетчик, начинающийся со времени запуска
+        # в мс, сдвинутого на 20 бит (миллион идентификаторов на мс без
+        # повторов), и не меньше уже выданных, чтобы id росли между запусками
+        self.id_counter = itertools.count(
+            max(int(time.time() * 1000) << 20, self._max_id() + 1)
+        )
         
         logger.info("Инициализирован менеджер данных")
         
     def _load_data(self) -> None:
         """
-        Загрузка данных из файлов
+        Загрузка данных из журнала
+        """
+        try:
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    try:
+                        record = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        # Недописанная строка в конце журнала после сбоя
+                        logger.error(f"Пропущена поврежденная запись журнала {self.log_path}")
+                        continue
+                        
+                    self.log_records += 1
+                    if record.get("deleted"):
+                        self.data.pop(record["id"], None)
+                    else:
+                        self.data[record["id"]] = DataInfo(**record)
+                        
+        except Exception as e:
+            logger.error(f"Ошибка загрузки данных: {str(e)}")
+            
+    def _index_add(self, data_info: DataInfo) -> None:
+        """
+        Добавление данных в индексы
+        
+        Args:
+            data_info: данные
+        """
+        self.by_type.setdefault(data_info.type, set()).add(data_info.id)
+        self.by_status.setdefault(data_info.status, set()).add(data_info.id)
+        
+    def _index_remove(self, index: Dict[str, set], key: str, id: str) -> None:
+        """
+        Удаление идентификатора из индекса
+        
+        Args:
+            index: индекс
+            key: значение индексируемого поля
+            id: идентификатор данных
+        """
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(id)
+            if not ids:
+                del index[key]
+                
+    def _max_id(self) -> int:
+        """
+        Наибольший из загруженных идентификаторов
+        
+        Десятичные идентификаторы старого формата (13 цифр миллисекунд),
+        прочитанные как шестнадцатеричные, меньше 2**52 - гораздо меньше
+        начала нового счетчика (мс << 20), поэтому на результат не влияют.
+        
+        Returns:
+            int: числовое значение идентификатора (0, если данных нет)
+        """
+        max_id = 0
+        for id in self.data:
+            try:
+                max_id = max(max_id, int(id, 16))
+            except ValueError:
+                continue
+        return max_id
+        
+    def _load_legacy_data(self) -> None:
+        """
+        Загрузка данных из отдельных JSON-файлов (формат до журнала)
         """
         try:
             # Загружаем данные из файлов
             for data_file in self.data_dir.glob("*.json"):
                 try:
-                    with open(data_file, "r", encoding="utf-8") as f:
-                        data = json.load(f)
+                    with open(data_file, "rb") as f:
+                        if os.fstat(f.fileno()).st_size <= MMAP_THRESHOLD:
+                            data = orjson.loads(f.read())
+                        else:
+                            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                                data = orjson.loads(memoryview(mm))
                         
                     # Создаем данные
                     data_info = DataInfo(
@@ -70,9 +222,26 @@ class Data:
         except Exception as e:
             logger.error(f"Ошибка загрузки данных: {str(e)}")
             
+    def _append_records(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Добавление записей в журнал одной операцией записи
+        
+        Args:
+            records: записи журнала
+        """
+        with self.lock:
+            self.log.write(b"".join(orjson.dumps(record) + b"\n" for record in records))
+            self.log.flush()
+            if self.fsync:
+                os.fsync(self.log.fileno())
+                
+            self.log_records += len(records)
+            if self.log_records > max(COMPACT_MIN_RECORDS, COMPACT_RATIO * len(self.data)):
+                self.compact()
+            
     def _save_data(self, id: str) -> bool:
         """
-        Сохранение данных в файл
+        Сохранение данных в журнал
         
         Args:
             id: идентификатор данных
@@ -81,19 +250,97 @@ class Data:
             bool: успешность сохранения
         """
         try:
-            # Создаем файл
-            data_file = self.data_dir / f"{id}.json"
+            self._append_records([self.data[id].to_dict()])
+            return True
+            
+        except Exception as e:
+            logger.error(f"Ошибка сохранения данных {id}: {str(e)}")
+            return False
             
-            # Сохраняем данные
-            with open(data_file, "w", encoding="utf-8") as f:
-                json.dump(asdict(self.data[id]), f, ensure_ascii=False, indent=2)
+    def compact(self) -> bool:
+        """
+        Сжатие журнала: остается по одной записи на каждые живые данные
+        
+        Журнал переписывается во временный файл, который затем атомарно
+        заменяет старый. Снимок включает и еще не записанные изменения.
+        
+        Returns:
+            bool: успешность сжатия
+        """
+        try:
+            with self.lock:
+                tmp_path = self.log_path.with_name(LOG_FILE + ".tmp")
+                with open(tmp_path, "wb") as f:
+                    for data_info in self.data.values():
+                        f.write(orjson.dumps(data_info.to_dict()) + b"\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                    
+                log = getattr(self, "log", None)
+                if log is not None:
+                    log.close()
+                try:
+                    os.replace(tmp_path, self.log_path)
+                finally:
+                    if log is not None:
+                        self.log = open(self.log_path, "ab", buffering=1 << 20)
+                        
+                self.dirty.clear()
+                self.log_records = len(self.data)
                 
+            logger.info(f"Журнал данных сжат до {self.log_records} записей")
             return True
             
         except Exception as e:
-            logger.error(f"Ошибка сохранения данных {id}: {str(e)}")
+            logger.error(f"Ошибка сжатия журнала данных: {str(e)}")
             return False
             
+    def _schedule_flush(self) -> None:
+        """
+        Планирование записи накопленных изменений
+        """
+        with self.lock:
+            if len(self.dirty) >= FLUSH_MAX_DIRTY:
+                self.flush()
+            elif self.flush_timer is None:
+                self.flush_timer = threading.Timer(FLUSH_INTERVAL, self.flush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+                
+    def flush(self) -> bool:
+        """
+        Запись накопленных изменений в журнал одной порцией
+        
+        Returns:
+            bool: успешность записи
+        """
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+                
+            if not self.dirty:
+                return True
+                
+            ids, self.dirty = self.dirty, set()
+            try:
+                self._append_records([self.data[id].to_dict() for id in ids if id in self.data])
+                return True
+                
+            except Exception as e:
+                logger.error(f"Ошибка сохранения данных: {str(e)}")
+                return False
+                
+    def close(self) -> None:
+        """
+        Запись накопленных изменений и закрытие журнала
+        """
+        with self.lock:
+            if self.log.closed:
+                return
+            self.flush()
+            self.log.close()
+            
     def add_data(self, type: str, path: str, metadata: Dict[str, Any]) -> Optional[str]:
         """
         Добавление данных
@@ -108,21 +355,26 @@ class Data:
         """
         try:
             # Создаем данные
+            now = time.time()
             data_info = DataInfo(
-                id=str(int(time.time() * 1000)),
+                id=format(next(self.id_counter), "x"),
                 type=type,
                 path=path,
-                created_at=time.time(),
-                updated_at=time.time(),
+                created_at=now,
+                updated_at=now,
                 metadata=metadata,
                 status="pending"
             )
             
-            # Добавляем данные
-            self.data[data_info.id] = data_info
-            
-            # Сохраняем данные
-            if self._save_data(data_info.id):
+            with self.lock:
+                # Добавляем данные
+                self.data[data_info.id] = data_info
+                self._index_add(data_info)
+                
+                # Сохраняем данные
+                saved = self._save_data(data_info.id)
+                
+            if saved:
                 logger.info(f"Добавлены данные {data_info.id}")
                 return data_info.id
                 
@@ -142,16 +394,10 @@ class Data:
         Returns:
             Optional[DataInfo]: данные
         """
-        try:
-            if id not in self.data:
-                logger.error(f"Данные {id} не найдены")
-                return None
-                
-            return self.data[id]
-            
-        except Exception as e:
-            logger.error(f"Ошибка получения данных {id}: {str(e)}")
-            return None
+        data_info = self.data.get(id)
+        if data_info is None:
+            logger.error(f"Данные {id} не найдены")
+        return data_info
             
     def update_data(self, id: str, status: Optional[str] = None, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> bool:
         """
@@ -167,27 +413,32 @@ class Data:
             bool: успешность обновления
         """
         try:
-            if id not in self.data:
-                logger.error(f"Данные {id} не найдены")
-                return False
-                
-            # Получаем данные
-            data = self.data[id]
-            
-            # Обновляем данные
-            if status is not None:
-                data.status = status
-                
-            if result is not None:
-                data.result = result
+            with self.lock:
+                if id not in self.data:
+                    logger.error(f"Данные {id} не найдены")
+                    return False
+                    
+                # Получаем данные
+                data = self.data[id]
                 
-            if error is not None:
-                data.error = error
+                # Обновляем данные
+                if status is not None and status != data.status:
+                    self._index_remove(self.by_status, data.status, id)
+                    data.status = status
+                    self.by_status.setdefault(status, set()).add(id)
+                    
+                if result is not None:
+                    data.result = result
+                    
+                if error is not None:
+                    data.error = error
+                    
+                data.updated_at = time.time()
                 
-            data.updated_at = time.time()
-            
-            # Сохраняем данные
-            return self._save_data(id)
+                # Запись откладывается: частые смены статуса пишутся одной порцией
+                self.dirty.add(id)
+                self._schedule_flush()
+            return True
             
         except Exception as e:
             logger.error(f"Ошибка обновления данных {id}: {str(e)}")
@@ -204,17 +455,19 @@ class Data:
             bool: успешность удаления
         """
         try:
-            if id not in self.data:
-                logger.error(f"Данные {id} не найдены")
-                return False
-                
-            # Удаляем файл
-            data_file = self.data_dir / f"{id}.json"
-            if data_file.exists():
-                data_file.unlink()
+            with self.lock:
+                if id not in self.data:
+                    logger.error(f"Данные {id} не найдены")
+                    return False
+                    
+                # Удаляем данные
+                data_info = self.data.pop(id)
+                self._index_remove(self.by_type, data_info.type, id)
+                self._index_remove(self.by_status, data_info.status, id)
+                self.dirty.discard(id)
                 
-            # Удаляем данные
-            del self.data[id]
+                # Отмечаем удаление в журнале
+                self._append_records([{"id": id, "deleted": True}])
             
             logger.info(f"Удалены данные {id}")
             return True
@@ -234,21 +487,22 @@ class Data:
         Returns:
             List[DataInfo]: список данных
         """
-        try:
-            # Фильтруем данные
-            data_list = self.data.values()
-            
-            if type is not None:
-                data_list = [data for data in data_list if data.type == type]
+        with self.lock:
+            if type is None and status is None:
+                return list(self.data.values())
                 
-            if status is not None:
-                data_list = [data for data in data_list if data.status == status]
+            # Фильтруем данные по индексам
+            empty = set()
+            if type is None:
+                ids = self.by_status.get(status, empty)
+            elif status is None:
+                ids = self.by_type.get(type, empty)
+            else:
+                ids = self.by_type.get(type, empty) & self.by_status.get(status, empty)
                 
-            return list(data_list)
-            
-        except Exception as e:
-            logger.error(f"Ошибка получения списка данных: {str(e)}")
-            return []
+            # Порядок добавления; идентификаторы из старого формата (десятичные
+            # миллисекунды) по строке с новыми не сравнимы, поэтому по времени
+            return sorted((self.data[id] for id in ids), key=attrgetter("created_at", "id"))
             
     def get_data_stats(self) -> Dict[str, int]:
         """
@@ -257,27 +511,9 @@ class Data:
         Returns:
             Dict[str, int]: статистика
         """
-        try:
-            stats = {
+        with self.lock:
+            return {
                 "total": len(self.data),
-                "types": {},
-                "status": {}
-            }
-            
-            # Считаем количество данных по типам и статусам
-            for data in self.data.values():
-                if data.type not in stats["types"]:
-                    stats["types"][data.type] = 0
-                    
-                stats["types"][data.type] += 1
-                
-                if data.status not in stats["status"]:
-                    stats["status"][data.status] = 0
-                    
-                stats["status"][data.status] += 1
-                
-            return stats
-            
-        except Exception as e:
-            logger.error(f"Ошибка получения статистики данных: {str(e)}")
-            return {} 
\ No newline at end of file
+                "types": {type: len(ids) for type, ids in self.by_type.items()},
+                "status": {status: len(ids) for status, ids in self.by_status.items()}
+            } 
\ No newline at end of file
@@ -2,22 +2,66 @@ import re
 from typing import Dict, List, Optional, Union
 from datetime import datetime
 import logging
+from functools import lru_cache
+
+import numpy as np
+import regex
 
 logger = logging.getLogger("DataExtractor")
 
+# Регулярные выражения для извлечения данных, компилируются один раз при импорте.
+# Притяжательные квантификаторы (*+, ++) модуля regex не отдают захваченное
+# назад, поэтому на зашумленном тексте OCR без совпадения поиск остается
+# линейным, а не перебирает все разбиения длинных серий цифр и пробелов
+FIELD_PATTERNS = {
+    'invoice_number': regex.compile(r'(?:Счет|Invoice)[\s№#]*+([A-ZА-Я0-9-]++)', regex.I),
+    'date': regex.compile(r'(?:от|from)?\s*+(\d{2}[./-]\d{2}[./-]\d{4})'),
+    'total_amount': regex.compile(r'(?:Итого|Total)[\s:]*+(\d++(?:[\s.,]\d*+)?+)\s*+(?:руб|₽|RUB)', regex.I),
+    'supplier_name': regex.compile(r'(?:Поставщик|Supplier)[\s:]*+([^\n]++)', regex.I),
+    'inn': regex.compile(r'(?:ИНН|INN)[\s:]*+(\d{10}|\d{12})', regex.I),
+    'address': regex.compile(r'(?:Адрес|Address)[\s:]*+([^\n]++)', regex.I),
+    'payment_info': regex.compile(r'(?:Реквизиты|Payment Info)[\s:]*+([^\n]++)', regex.I)
+}
+
+# Разделитель колонок в строке таблицы: два и более пробельных символа
+COLUMN_SPLIT = re.compile(r'\s{2,}')
+
+# Строка заголовка таблицы: любое из названий колонок, без учета регистра
+TABLE_HEADER = re.compile(r'наименование|количество|цена|сумма', re.I)
+
+# Приведение числа к виду для float(): без пробелов, запятая -> точка
+NUMBER_TRANSLATION = str.maketrans({' ': None, ',': '.'})
+
+# Разделители даты приводятся к точке
+DATE_TRANSLATION = str.maketrans('/-', '..')
+DATE_FORMAT = '%d.%m.%Y'
+
+@lru_cache(maxsize=4096)
+def _normalize_date(date_str: str) -> str:
+    """Нормализация даты к DD.MM.YYYY (одинаковые строки разбираются один раз)"""
+    date_str = date_str.translate(DATE_TRANSLATION)
+    
+    try:
+        return datetime.strptime(date_str, DATE_FORMAT).strftime(DATE_FORMAT)
+    except ValueError:
+        logger.error(f"Ошибка при парсинге даты: {date_str}")
+        return date_str
+        
+@lru_cache(maxsize=4096)
+def _normalize_amount(amount_str: str) -> str:
+    """Нормализация суммы к виду с двумя знаками (одинаковые строки разбираются один раз)"""
+    amount_str = amount_str.translate(NUMBER_TRANSLATION)
+    
+    try:
+        return f"{float(amount_str):.2f}"
+    except ValueError:
+        logger.error(f"Ошибка при парсинге суммы: {amount_str}")
+        return amount_str
+
 class DataExtractor:
     def __init__(self):
         """Инициализация экстрактора данных"""
-        # Регулярные выражения для извлечения данных
-        self.patterns = {
-            'invoice_number': re.compile(r'(?:Счет|Invoice)[\s№#]*([A-ZА-Я0-9-]+)', re.I),
-            'date': re.compile(r'(?:от|from)?\s*(\d{2}[./-]\d{2}[./-]\d{4})'),
-            'total_amount': re.compile(r'(?:Итого|Total)[\s:]*(\d+[\s.,]?\d*)\s*(?:руб|₽|RUB)', re.I),
-            'supplier_name': re.compile(r'(?:Поставщик|Supplier)[\s:]*([^\n]+)', re.I),
-            'inn': re.compile(r'(?:ИНН|INN)[\s:]*(\d{10}|\d{12})', re.I),
-            'address': re.compile(r'(?:Адрес|Address)[\s:]*([^\n]+)', re.I),
-            'payment_info': re.compile(r'(?:Реквизиты|Payment Info)[\s:]*([^\n]+)', re.I)
-        }
+        self.patterns = FIELD_PATTERNS
         
     def extract_data(self, 
                     text: str, 
@@ -80,16 +124,7 @@ class DataExtractor:
         Returns:
             str: нормализованная дата в формате DD.MM.YYYY
         """
-        # Замена разделителей
-        date_str = date_str.replace('/', '.').replace('-', '.')
-        
-        try:
-            # Парсинг даты
-            date = datetime.strptime(date_str, '%d.%m.%Y')
-            return date.strftime('%d.%m.%Y')
-        except ValueError:
-            logger.error(f"Ошибка при парсинге даты: {date_str}")
-            return date_str
+        return _normalize_date(date_str)
             
     def _normalize_amount(self, amount_str: str) -> str:
         """
@@ -101,16 +136,7 @@ class DataExtractor:
         Returns:
             str: нормализованная сумма
         """
-        # Удаление пробелов и замена запятой на точку
-        amount_str = amount_str.replace(' ', '').replace(',', '.')
-        
-        try:
-            # Преобразование в float и обратно в строку
-            amount = float(amount_str)
-            return f"{amount:.2f}"
-        except ValueError:
-            logger.error(f"Ошибка при парсинге суммы: {amount_str}")
-            return amount_str
+        return _normalize_amount(amount_str)
             
     def _normalize_inn(self, inn_str: str) -> str:
         """
@@ -122,8 +148,8 @@ class DataExtractor:
         Returns:
             str: нормализованный ИНН
         """
-        # Удаление всех нецифровых символов
-        inn_str = re.sub(r'\D', '', inn_str)
+        # Удаление всех нецифровых символов (isdecimal совпадает с \d)
+        inn_str = ''.join(filter(str.isdecimal, inn_str))
         
         # Проверка длины
         if len(inn_str) not in [10, 12]:
@@ -147,28 +173,57 @@ class DataExtractor:
         # Разбиваем текст на строки
         lines = text.split('\n')
         
-        items = []
+        rows = []
+        numbers = []
         for line in lines:
             # Пропускаем пустые строки и заголовки
-            if not line.strip() or any(header in line.lower() for header in ['наименование', 'количество', 'цена', 'сумма']):
+            if not line.strip() or TABLE_HEADER.search(line):
                 continue
                 
             # Разбиваем строку на колонки
-            columns = re.split(r'\s{2,}', line.strip())
+            columns = COLUMN_SPLIT.split(line.strip())
             
             if len(columns) >= 4:  # Минимальное количество колонок
-                item = {
-                    'name': columns[0],
-                    'quantity': self._parse_number(columns[1]),
-                    'price': self._parse_number(columns[2]),
-                    'amount': self._parse_number(columns[3]),
-                    'confidence': confidence,
-                    'raw_text': line
-                }
-                items.append(item)
+                rows.append((columns[0], line))
+                numbers.extend(columns[1:4])
                 
+        # Числа всех строк разбираются одним вызовом
+        values = self._parse_numbers(numbers)
+        
+        items = []
+        for i, (name, line) in enumerate(rows):
+            items.append({
+                'name': name,
+                'quantity': values[3 * i],
+                'price': values[3 * i + 1],
+                'amount': values[3 * i + 2],
+                'confidence': confidence,
+                'raw_text': line
+            })
+            
         return items
         
+    def _parse_numbers(self, texts: List[str]) -> List[Optional[float]]:
+        """
+        Парсинг списка числовых значений
+        
+        Args:
+            texts: строки с числами
+            
+        Returns:
+            List[Optional[float]]: распарсенные числа (None для нечисловых)
+        """
+        if not texts:
+            return []
+            
+        cleaned = [text.translate(NUMBER_TRANSLATION) for text in texts]
+        try:
+            # Преобразование всего массива строк в C; при первой же
+            # нечисловой строке разбираем поэлементно
+            return np.asarray(cleaned).astype(np.float64).tolist()
+        except ValueError:
+            return [self._parse_number(text) for text in texts]
+        
     def _parse_number(self, text: str) -> Optional[float]:
         """
         Парсинг числового значения
@@ -180,7 +235,7 @@ class DataExtractor:
             Optional[float]: распарсенное число или None
         """
         # Удаление пробелов и замена запятой на точку
-        text = text.replace(' ', '').replace(',', '.')
+        text = text.translate(NUMBER_TRANSLATION)
         
         try:
             return float(text)
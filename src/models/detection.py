@@ -4,16 +4,373 @@ import numpy as np
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import nullcontext
+from functools import lru_cache
 
 logger = logging.getLogger("InvoiceDetector")
 
+# TensorRT-движок принимает пакеты от 1 до TRT_MAX_BATCH изображений
+# размером TRT_IMAGE_SIZE (размер входа YOLOv5 по умолчанию)
+TRT_MAX_BATCH = 8
+TRT_IMAGE_SIZE = 640
+# Калибровка INT8: не более TRT_CALIBRATION_IMAGES изображений счетов
+TRT_CALIBRATION_IMAGES = 500
+
+# Одновременные вызовы detect, пришедшие в пределах BATCH_MAX_WAIT секунд
+# от первого, выполняются одним вызовом модели
+BATCH_MAX_WAIT = 0.005
+
+# Кэш детекций по перцептивному хэшу: число шаблонов и число попаданий,
+# после которого шаблон заново проверяется моделью
+DETECTION_CACHE_SIZE = 256
+DETECTION_CACHE_REFRESH = 16
+
+# Цвета областей при визуализации (BGR)
+CLASS_COLORS = {
+    'invoice_number': (255, 0, 0),    # Синий
+    'date': (0, 255, 0),              # Зеленый
+    'total_amount': (0, 0, 255),      # Красный
+    'supplier_name': (255, 255, 0),   # Голубой
+    'inn': (255, 0, 255),             # Пурпурный
+    'items_table': (0, 255, 255),     # Желтый
+    'address': (128, 128, 0),         # Темно-желтый
+    'payment_info': (128, 0, 128),    # Темно-пурпурный
+    'logo': (0, 128, 128)             # Темно-голубой
+}
+
+@lru_cache(maxsize=256)
+def _label_size(label: str) -> Tuple[int, int]:
+    """Размер подписи области в пикселях (одинаковые подписи измеряются один раз)"""
+    return cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0]
+
+@lru_cache(maxsize=1)
+def _opencv_cuda_available() -> bool:
+    """OpenCV собран с поддержкой CUDA и видит GPU"""
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+def _copy_detections(detections: Dict[str, List[int]]) -> Dict[str, List[int]]:
+    """Копия детекций вместе со списками координат"""
+    return {region_type: list(bbox) for region_type, bbox in detections.items()}
+
+def _phash(image: np.ndarray) -> int:
+    """
+    Перцептивный хэш изображения (pHash, 64 бита)
+    
+    Args:
+        image: изображение
+        
+    Returns:
+        int: хэш; у похожих изображений отличается в немногих битах
+    """
+    if image.ndim == 2:
+        gray = image
+    elif image.shape[2] == 4:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY)
+    else:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    
+    # Низкие частоты DCT сравниваются с медианой (без постоянной составляющей)
+    low = cv2.dct(small)[:8, :8].ravel()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+class DetectionCache:
+    """
+    Кэш детекций для счетов с повторяющейся версткой
+    
+    Счета одного поставщика обычно сделаны по одному шаблону, и области
+    на них совпадают. Изображения того же размера, pHash которых
+    отличается не более чем на threshold_bits бит, получают сохраненные
+    детекции без вызова модели.
+    """
+    
+    def __init__(self, threshold_bits: int = 4, max_size: int = DETECTION_CACHE_SIZE,
+                 refresh: int = DETECTION_CACHE_REFRESH):
+        self.threshold_bits = threshold_bits
+        self.max_size = max_size
+        self.refresh = refresh
+        # (размер изображения, pHash) -> [детекции, число попаданий]
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        
+    def lookup(self, image: np.ndarray) -> Tuple[tuple, Optional[Dict[str, List[int]]]]:
+        """
+        Поиск детекций для изображения
+        
+        Args:
+            image: изображение счета
+            
+        Returns:
+            tuple: ключ изображения для store и детекции (None при промахе)
+        """
+        key = (image.shape, _phash(image))
+        with self.lock:
+            for entry_key, entry in self.entries.items():
+                if entry_key[0] != key[0] or bin(entry_key[1] ^ key[1]).count("1") > self.threshold_bits:
+                    continue
+                    
+                entry[1] += 1
+                if entry[1] > self.refresh:
+                    # Шаблон перепроверяется моделью
+                    del self.entries[entry_key]
+                    return key, None
+                self.entries.move_to_end(entry_key)
+                return key, _copy_detections(entry[0])
+                
+        return key, None
+        
+    def store(self, key: tuple, detections: Dict[str, List[int]]):
+        """
+        Сохранение детекций
+        
+        Args:
+            key: ключ изображения из lookup
+            detections: детекции модели
+        """
+        with self.lock:
+            self.entries[key] = [_copy_detections(detections), 0]
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                
+    def clear(self):
+        """Очистка кэша"""
+        with self.lock:
+            self.entries.clear()
+
+def _letterbox(image: np.ndarray, size: int = TRT_IMAGE_SIZE) -> np.ndarray:
+    """
+    Подготовка изображения ко входу движка так же, как это делает YOLOv5
+    
+    Args:
+        image: изображение в BGR
+        size: сторона квадратного входа
+        
+    Returns:
+        np.ndarray: тензор [3, size, size] в RGB, значения 0..1
+    """
+    h, w = image.shape[:2]
+    scale = size / max(h, w)
+    resized = cv2.resize(image, (round(w * scale), round(h * scale)),
+                         interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top = (size - resized.shape[0]) // 2
+    left = (size - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB).transpose(2, 0, 1).astype(np.float32) / 255
+    
+def _make_calibrator(trt, calibration_dir: Optional[Path], cache_path: Path, batch_size: int):
+    """
+    Энтропийный калибратор INT8 на изображениях счетов
+    
+    Таблица калибровки сохраняется в cache_path; при ее наличии
+    изображения не читаются.
+    
+    Args:
+        trt: модуль tensorrt
+        calibration_dir: директория с изображениями для калибровки
+        cache_path: путь к таблице калибровки
+        batch_size: размер пакета калибровки
+        
+    Returns:
+        trt.IInt8EntropyCalibrator2: калибратор
+    """
+    class InvoiceEntropyCalibrator(trt.IInt8EntropyCalibrator2):
+        def __init__(self):
+            super().__init__()
+            self.batches = self._read_batches()
+            self.device_batch = None
+            
+        def _read_batches(self):
+            if calibration_dir is None:
+                return
+            files = sorted(
+                path for path in Path(calibration_dir).iterdir()
+                if path.suffix.lower() in ('.jpg', '.jpeg', '.png')
+            )[:TRT_CALIBRATION_IMAGES]
+            # Неполный последний пакет отбрасывается: размер пакета фиксирован
+            for start in range(0, len(files) - batch_size + 1, batch_size):
+                images = [cv2.imread(str(path)) for path in files[start:start + batch_size]]
+                if all(image is not None for image in images):
+                    yield np.stack([_letterbox(image) for image in images])
+                    
+        def get_batch_size(self):
+            return batch_size
+            
+        def get_batch(self, names):
+            batch = next(self.batches, None)
+            if batch is None:
+                return None
+            self.device_batch = torch.from_numpy(batch).cuda()
+            return [int(self.device_batch.data_ptr())]
+            
+        def read_calibration_cache(self):
+            return cache_path.read_bytes() if cache_path.exists() else None
+            
+        def write_calibration_cache(self, cache):
+            cache_path.write_bytes(cache)
+            
+    return InvoiceEntropyCalibrator()
+    
+def build_engine(model_path: Path, max_batch: int = TRT_MAX_BATCH, precision: str = 'fp16',
+                 calibration_dir: Optional[str] = None) -> Path:
+    """
+    Сборка TensorRT-движка FP16 или INT8 из весов YOLOv5
+    
+    Веса экспортируются в ONNX с динамическим размером пакета, движок
+    собирается с профилем оптимизации на пакеты 1..max_batch и
+    сохраняется рядом с .pt; max_batch входит в имя файла, при наличии
+    файла сборка пропускается.
+    Для INT8 диапазоны активаций калибруются на изображениях из
+    calibration_dir, таблица калибровки также сохраняется рядом с .pt.
+    
+    Args:
+        model_path: путь к весам YOLOv5 (.pt)
+        max_batch: наибольший размер пакета
+        precision: 'fp16' или 'int8'
+        calibration_dir: директория с изображениями счетов для калибровки INT8
+        
+    Returns:
+        Path: путь к сериализованному движку
+    """
+    if precision not in ('fp16', 'int8'):
+        raise ValueError(f"Неподдерживаемая точность TensorRT: {precision}")
+        
+    model_path = Path(model_path)
+    if precision == 'int8':
+        engine_path = model_path.with_name(f"{model_path.stem}.int8.b{max_batch}.engine")
+        cache_path = model_path.with_name(f"{model_path.stem}.int8.cache")
+        if calibration_dir is None and not cache_path.exists():
+            raise ValueError("Для INT8 нужна директория с изображениями для калибровки")
+    else:
+        engine_path = model_path.with_name(f"{model_path.stem}.b{max_batch}.engine")
+    if engine_path.exists():
+        return engine_path
+        
+    import tensorrt as trt
+    from yolov5 import export
+    
+    logger.info(f"Сборка TensorRT-движка для {model_path}")
+    export.run(weights=str(model_path), imgsz=(TRT_IMAGE_SIZE, TRT_IMAGE_SIZE),
+               include=('onnx',), dynamic=True)
+    onnx_path = model_path.with_suffix('.onnx')
+    
+    trt_logger = trt.Logger(trt.Logger.WARNING)
+    builder = trt.Builder(trt_logger)
+    network = builder.create_network(1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH))
+    parser = trt.OnnxParser(network, trt_logger)
+    if not parser.parse(onnx_path.read_bytes()):
+        raise RuntimeError(f"Ошибка разбора ONNX {onnx_path}: {parser.get_error(0)}")
+        
+    config = builder.create_builder_config()
+    config.set_memory_pool_limit(trt.MemoryPoolType.WORKSPACE, 1 << 30)
+    if builder.platform_has_fast_fp16:
+        config.set_flag(trt.BuilderFlag.FP16)
+        
+    # Профиль: минимальный, оптимальный и наибольший размер пакета
+    shape = (3, TRT_IMAGE_SIZE, TRT_IMAGE_SIZE)
+    profile = builder.create_optimization_profile()
+    profile.set_shape(network.get_input(0).name,
+                      (1, *shape), (max(1, max_batch // 2), *shape), (max_batch, *shape))
+    config.add_optimization_profile(profile)
+    
+    if precision == 'int8':
+        # Слои без INT8-реализации остаются в FP16
+        config.set_flag(trt.BuilderFlag.INT8)
+        config.int8_calibrator = _make_calibrator(trt, calibration_dir, cache_path, max_batch)
+        config.set_calibration_profile(profile)
+    
+    engine = builder.build_serialized_network(network, config)
+    if engine is None:
+        raise RuntimeError(f"Не удалось собрать TensorRT-движок из {onnx_path}")
+    engine_path.write_bytes(engine)
+    logger.info(f"TensorRT-движок сохранен: {engine_path}")
+    return engine_path
+
+class DynamicBatcher:
+    """
+    Объединение одновременных вызовов детектора в пакеты
+    
+    Запросы из разных потоков складываются в очередь; фоновый поток
+    забирает до max_batch запросов, ожидая не дольше max_wait после
+    первого, и выполняет их одним вызовом модели. Модель при
+    этом вызывается только из одного потока.
+    """
+    
+    def __init__(self, detector: "InvoiceDetector", max_batch: int = TRT_MAX_BATCH,
+                 max_wait: float = BATCH_MAX_WAIT):
+        self.detector = detector
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="DynamicBatcher", daemon=True)
+        self.thread.start()
+        
+    def submit(self, image: np.ndarray) -> Future:
+        """
+        Постановка изображения в очередь на детекцию
+        
+        Args:
+            image: изображение счета
+            
+        Returns:
+            Future: будущий результат detect для этого изображения
+        """
+        future = Future()
+        self.requests.put((image, future))
+        return future
+        
+    def _run(self):
+        """Сбор пакетов из очереди и их детекция"""
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                    
+            try:
+                detections = self.detector._detect_batch([image for image, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+                
+            # Каждый вызывающий получает свою строку результата
+            for (_, future), result in zip(batch, detections):
+                future.set_result(result)
+
 class InvoiceDetector:
-    def __init__(self, model_path: Optional[str] = None):
+    def __init__(self, model_path: Optional[str] = None, use_tensorrt: bool = False,
+                 cache_threshold_bits: Optional[int] = None, trt_precision: str = 'fp16',
+                 calibration_dir: Optional[str] = None):
         """
         Инициализация детектора областей счета
         
         Args:
             model_path: путь к модели YOLOv5
+            use_tensorrt: выполнять модель через TensorRT-движок (только GPU)
+            cache_threshold_bits: наибольшее расстояние Хэмминга между pHash
+                изображений, при котором используются кэшированные детекции
+                (None - без кэша). Кэш приблизительный: счета одного шаблона
+                с разным содержимым получат одни и те же области, поэтому
+                включается только явно
+            trt_precision: точность TensorRT-движка, 'fp16' или 'int8'
+            calibration_dir: изображения счетов для калибровки INT8
         """
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         logger.info(f"Используется устройство: {self.device}")
@@ -22,18 +379,46 @@ class InvoiceDetector:
             # Используем предобученную модель по умолчанию
             model_path = Path(__file__).parent / "weights" / "invoice_detector.pt"
             
+        # Движок TensorRT собран с фиксированной точностью (FP16 или INT8)
+        self.engine = False
+        
         if not Path(model_path).exists():
             logger.warning(f"Модель не найдена по пути {model_path}. Используется детектор по умолчанию.")
             self.model = None
         else:
+            if use_tensorrt and self.device.type == 'cuda':
+                try:
+                    model_path = build_engine(model_path, precision=trt_precision,
+                                              calibration_dir=calibration_dir)
+                    self.engine = True
+                except Exception as e:
+                    logger.error(f"Ошибка сборки TensorRT-движка, используется PyTorch: {str(e)}")
+                    
             try:
-                self.model = torch.hub.load('ultralytics/yolov5', 'custom', path=model_path)
+                # Модель создается из установленного пакета yolov5, без загрузки
+                # репозитория через torch.hub. Загрузчик принимает и .pt, и
+                # .engine: для движка буферы на GPU выделяются один раз
+                import yolov5
+                self.model = yolov5.load(str(model_path),
+                                         device='0' if self.device.type == 'cuda' else 'cpu')
                 self.model.to(self.device)
                 logger.info(f"Модель загружена из {model_path}")
             except Exception as e:
                 logger.error(f"Ошибка при загрузке модели: {str(e)}")
                 self.model = None
                 
+        # Точность вычислений модели на GPU: 'fp32', 'fp16' или 'bf16'
+        self.precision = 'fp32'
+        
+        # Пакетный режим для вызовов detect из нескольких потоков
+        self.batcher: Optional[DynamicBatcher] = None
+        
+        # Вызовы модели и смена точности весов выполняются по одному
+        self.lock = threading.Lock()
+        
+        # Кэш детекций для повторяющихся шаблонов счетов
+        self.cache = DetectionCache(cache_threshold_bits) if cache_threshold_bits is not None else None
+        
         # Классы для детекции
         self.classes = {
             0: 'invoice_number',
@@ -47,6 +432,52 @@ class InvoiceDetector:
             8: 'logo'
         }
         
+    def set_precision(self, precision: str):
+        """
+        Установка точности вычислений модели
+        
+        Действует только на GPU. Для FP16 в половинную точность переводятся
+        веса модели, BF16 применяется через autocast при вызове модели.
+        
+        Args:
+            precision: 'fp32', 'fp16' или 'bf16'
+        """
+        precision = precision.lower()
+        if precision not in ('fp32', 'fp16', 'bf16'):
+            raise ValueError(f"Неподдерживаемая точность: {precision}")
+            
+        if self.model is None or self.engine or self.device.type != 'cuda' or precision == self.precision:
+            return
+            
+        with self.lock:
+            if precision == 'fp16':
+                self.model.half()
+            else:
+                self.model.float()
+            self.precision = precision
+        if self.cache is not None:
+            self.cache.clear()
+        logger.info(f"Точность вычислений модели: {precision}")
+        
+    def enable_batching(self, max_batch: int = TRT_MAX_BATCH, max_wait: float = BATCH_MAX_WAIT):
+        """
+        Включение пакетного режима: одновременные вызовы detect
+        объединяются в один вызов модели
+        
+        Args:
+            max_batch: наибольший размер пакета
+            max_wait: время ожидания пакета после первого запроса, с
+        """
+        with self.lock:
+            if self.model is not None and self.batcher is None:
+                self.batcher = DynamicBatcher(self, max_batch, max_wait)
+            
+    def _autocast(self):
+        """Контекст вызова модели с учетом выбранной точности"""
+        if self.precision == 'bf16':
+            return torch.autocast('cuda', dtype=torch.bfloat16)
+        return nullcontext()
+        
     def detect(self, image: np.ndarray) -> Dict[str, List[int]]:
         """
         Детекция областей счета
@@ -61,15 +492,96 @@ class InvoiceDetector:
             # Если модель не загружена, используем детектор по умолчанию
             return self._default_detector(image)
             
-        # Предобработка изображения
-        img = self._preprocess_image(image)
+        if self.cache is not None:
+            key, detections = self.cache.lookup(image)
+            if detections is not None:
+                return detections
+                
+        detections = self._run_model([image])[0]
+        if self.cache is not None:
+            self.cache.store(key, detections)
+        return detections
+        
+    def detect_batch(self, images: List[np.ndarray]) -> List[Dict[str, List[int]]]:
+        """
+        Детекция областей для пакета счетов одним вызовом модели
         
-        # Детекция
-        results = self.model(img)
+        Args:
+            images: изображения счетов
+            
+        Returns:
+            List[Dict[str, List[int]]]: координаты областей для каждого изображения
+        """
+        if not images:
+            return []
+            
+        if self.model is None:
+            return [self._default_detector(image) for image in images]
+            
+        if self.cache is None:
+            return self._run_model(images)
+            
+        # Модель вызывается только для изображений, которых нет в кэше
+        lookups = [self.cache.lookup(image) for image in images]
+        misses = [i for i, (_, detections) in enumerate(lookups) if detections is None]
+        if misses:
+            for i, detections in zip(misses, self._run_model([images[i] for i in misses])):
+                self.cache.store(lookups[i][0], detections)
+                lookups[i] = (lookups[i][0], detections)
+                
+        return [detections for _, detections in lookups]
+        
+    def _run_model(self, images: List[np.ndarray]) -> List[Dict[str, List[int]]]:
+        """
+        Детекция изображений моделью: через пакетный режим, если он
+        включен, иначе напрямую
+        
+        Args:
+            images: изображения счетов
+            
+        Returns:
+            List[Dict[str, List[int]]]: координаты областей для каждого изображения
+        """
+        if self.batcher is None:
+            return self._detect_batch(images)
+        futures = [self.batcher.submit(image) for image in images]
+        return [future.result() for future in futures]
+        
+    def _detect_batch(self, images: List[np.ndarray]) -> List[Dict[str, List[int]]]:
+        """
+        Вызов модели для пакета изображений
         
-        # Обработка результатов
+        Args:
+            images: изображения счетов
+            
+        Returns:
+            List[Dict[str, List[int]]]: координаты областей для каждого изображения
+        """
+        # Движок принимает не больше TRT_MAX_BATCH изображений за вызов
+        if self.engine and len(images) > TRT_MAX_BATCH:
+            return [detections
+                    for start in range(0, len(images), TRT_MAX_BATCH)
+                    for detections in self._detect_batch(images[start:start + TRT_MAX_BATCH])]
+            
+        # Модель принимает список изображений и выполняет один batched forward
+        batch = [self._preprocess_image(image) for image in images]
+        with self.lock, self._autocast():
+            results = self.model(batch)
+        
+        return [self._parse_predictions(preds) for preds in results.xyxy]
+        
+    def _parse_predictions(self, preds) -> Dict[str, List[int]]:
+        """
+        Разбор предсказаний модели для одного изображения
+        
+        Args:
+            preds: тензор предсказаний [x1, y1, x2, y2, conf, cls]
+            
+        Returns:
+            Dict[str, List[int]]: словарь с координатами областей
+        """
         detections = {}
-        for pred in results.xyxy[0].cpu().numpy():
+        for pred in preds.cpu().numpy():
             x1, y1, x2, y2, conf, cls = pred
             if conf > 0.5:  # Порог уверенности
                 class_name = self.classes[int(cls)]
@@ -97,20 +609,35 @@ class InvoiceDetector:
         Returns:
             np.ndarray: обработанное изображение
         """
+        # Сначала уменьшаем, чтобы конвертация цвета шла уже по меньшему
+        # изображению: полноразмерный скан читается один раз
+        max_size = 1280
+        h, w = image.shape[:2]
+        if max(h, w) > max_size and image.ndim == 3 and image.shape[2] == 3 and _opencv_cuda_available():
+            # Скан загружается на GPU один раз, уменьшение и конвертация цвета
+            # идут там, обратно копируется только уменьшенное изображение
+            scale = max_size / max(h, w)
+            gpu_image = cv2.cuda_GpuMat()
+            gpu_image.upload(image)
+            gpu_image = cv2.cuda.resize(gpu_image, (round(w * scale), round(h * scale)),
+                                        interpolation=cv2.INTER_AREA)
+            return cv2.cuda.cvtColor(gpu_image, cv2.COLOR_BGR2RGB).download()
+            
+        resized = max(h, w) > max_size
+        if resized:
+            scale = max_size / max(h, w)
+            image = cv2.resize(image, None, fx=scale, fy=scale,
+                               interpolation=cv2.INTER_AREA)
+            
         # Конвертация в RGB
         if len(image.shape) == 2:
             image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
         elif image.shape[2] == 4:
             image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGB)
         elif image.shape[2] == 3:
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-        # Изменение размера
-        max_size = 1280
-        h, w = image.shape[:2]
-        if max(h, w) > max_size:
-            scale = max_size / max(h, w)
-            image = cv2.resize(image, None, fx=scale, fy=scale)
+            # Уменьшенная копия принадлежит нам и конвертируется на месте,
+            # исходное изображение вызывающего не изменяется
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image if resized else None)
             
         return image
         
@@ -127,9 +654,10 @@ class InvoiceDetector:
         # Конвертация в оттенки серого
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         
-        # Адаптивная бинаризация
+        # Адаптивная бинаризация по среднему в окне: boxFilter считается
+        # скользящими суммами за один проход, без свертки с ядром Гаусса
         binary = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+            gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, 
             cv2.THRESH_BINARY_INV, 11, 2
         )
         
@@ -143,61 +671,47 @@ class InvoiceDetector:
         min_area = (h * w) * 0.001  # Минимальная площадь 0.1% от изображения
         max_area = (h * w) * 0.5    # Максимальная площадь 50% от изображения
         
-        valid_contours = []
-        for cnt in contours:
-            area = cv2.contourArea(cnt)
-            if min_area < area < max_area:
-                valid_contours.append(cnt)
-                
-        # Преобразование контуров в прямоугольники
-        detections = {}
-        for i, cnt in enumerate(valid_contours):
-            x, y, w, h = cv2.boundingRect(cnt)
-            detections[f'region_{i}'] = [x, y, x + w, y + h]
+        areas = np.fromiter((cv2.contourArea(cnt) for cnt in contours),
+                            dtype=np.float64, count=len(contours))
+        valid = np.flatnonzero((areas > min_area) & (areas < max_area))
+        if not len(valid):
+            return {}
             
-        return detections
+        # Преобразование контуров в прямоугольники [x1, y1, x2, y2] одной операцией
+        boxes = np.array([cv2.boundingRect(contours[i]) for i in valid], dtype=np.int32)
+        boxes[:, 2:] += boxes[:, :2]
+        
+        return {f'region_{i}': box for i, box in enumerate(boxes.tolist())}
         
     def visualize_detections(self, 
                            image: np.ndarray, 
-                           detections: Dict[str, List[int]]) -> np.ndarray:
+                           detections: Dict[str, List[int]],
+                           inplace: bool = False) -> np.ndarray:
         """
         Визуализация детекций на изображении
         
         Args:
             image: исходное изображение
             detections: словарь с координатами областей
+            inplace: рисовать прямо на image, без копии (изображение
+                больше не нужно вызывающему)
             
         Returns:
             np.ndarray: изображение с визуализацией
         """
-        vis_image = image.copy()
-        
-        # Цвета для разных классов
-        colors = {
-            'invoice_number': (255, 0, 0),    # Синий
-            'date': (0, 255, 0),              # Зеленый
-            'total_amount': (0, 0, 255),      # Красный
-            'supplier_name': (255, 255, 0),   # Голубой
-            'inn': (255, 0, 255),             # Пурпурный
-            'items_table': (0, 255, 255),     # Желтый
-            'address': (128, 128, 0),         # Темно-желтый
-            'payment_info': (128, 0, 128),    # Темно-пурпурный
-            'logo': (0, 128, 128)             # Темно-голубой
-        }
+        vis_image = image if inplace else image.copy()
         
         # Отрисовка детекций
         for class_name, bbox in detections.items():
             x1, y1, x2, y2 = bbox
-            color = colors.get(class_name, (255, 255, 255))
+            color = CLASS_COLORS.get(class_name, (255, 255, 255))
             
             # Рисуем прямоугольник
             cv2.rectangle(vis_image, (x1, y1), (x2, y2), color, 2)
             
             # Добавляем подпись
-            label = f"{class_name}"
-            (label_w, label_h), _ = cv2.getTextSize(
-                label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1
-            )
+            label = class_name
+            label_w, label_h = _label_size(label)
             cv2.rectangle(
                 vis_image, 
                 (x1, y1 - label_h - 4), 
@@ -1,11 +1,21 @@
 import cv2
 import numpy as np
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from pathlib import Path
 import logging
 from datetime import datetime
 import json
 import os
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+from itertools import repeat
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import lru_cache
+
+import diskcache
+import orjson
 
 from .detection import InvoiceDetector
 from .ocr import OCRProcessor
@@ -22,12 +32,125 @@ logging.basicConfig(
 )
 logger = logging.getLogger("InvoiceProcessor")
 
+# Кэш результатов распознавания, общий для всех экземпляров и процессов
+RESULT_CACHE_DIR = Path.home() / ".cache" / "invoice_ocr"
+# Версия формата записей кэша: записи прежних форматов не используются
+RESULT_CACHE_VERSION = 2
+
+@lru_cache(maxsize=1)
+def _get_result_cache() -> diskcache.Cache:
+    """Кэш результатов распознавания (открывается при первом обращении)"""
+    return diskcache.Cache(str(RESULT_CACHE_DIR))
+
+# Области, текст которых не используется (OCR для них не выполняется)
+OCR_SKIP_REGIONS = frozenset({'logo'})
+# Области меньше этой площади (px²) не распознаются: текста в них не прочитать
+MIN_OCR_AREA = 400
+
+# Поля структурированных данных: (раздел или None, поле, тип области)
+STRUCTURED_FIELDS = (
+    (None, 'invoice_number', 'invoice_number'),
+    (None, 'date', 'date'),
+    (None, 'total_amount', 'total_amount'),
+    ('supplier', 'name', 'supplier_name'),
+    ('supplier', 'inn', 'inn'),
+    ('supplier', 'address', 'address'),
+    (None, 'payment_info', 'payment_info'),
+)
+
+# Растеризованные PDF: временный кэш с вытеснением давно не используемых
+PDF_CACHE_DIR = Path(tempfile.gettempdir()) / "invoice_pdf_cache"
+PDF_DPI = 150
+
+@lru_cache(maxsize=1)
+def _get_pdf_cache() -> diskcache.Cache:
+    """Кэш растеризованных PDF (не более 2 ГБ)"""
+    return diskcache.Cache(
+        str(PDF_CACHE_DIR), size_limit=2 << 30, eviction_policy="least-recently-used"
+    )
+
+def _render_pdf(content: bytes, digest: str, dpi: int = PDF_DPI) -> Optional[np.ndarray]:
+    """
+    Растеризация первой страницы PDF
+    
+    Результат хранится в кэше в PNG по ключу (SHA-256 файла, dpi),
+    поэтому повторная обработка того же PDF не вызывает poppler.
+    
+    Args:
+        content: содержимое PDF
+        digest: SHA-256 содержимого
+        dpi: разрешение растеризации
+        
+    Returns:
+        np.ndarray: изображение страницы в BGR или None
+    """
+    cache = _get_pdf_cache()
+    key = f"{digest}:{dpi}"
+    png = cache.get(key)
+    if png is None:
+        from pdf2image import convert_from_bytes
+        pages = convert_from_bytes(content, dpi=dpi, first_page=1, last_page=1)
+        if not pages:
+            return None
+        page = cv2.cvtColor(np.asarray(pages[0].convert("RGB")), cv2.COLOR_RGB2BGR)
+        png = cv2.imencode(".png", page)[1].tobytes()
+        cache[key] = png
+    return cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_COLOR)
+
+def decode_image(content: bytes, name: str):
+    """
+    Декодирование содержимого файла счета с вычислением хэша
+    
+    PDF (по расширению имени или сигнатуре %PDF) растеризуется,
+    остальные файлы декодируются OpenCV.
+    
+    Args:
+        content: содержимое файла
+        name: имя файла (для определения формата и сообщений)
+        
+    Returns:
+        tuple: SHA-256 содержимого и декодированное изображение
+            (None вместо изображения, если декодировать не удалось)
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    if name.lower().endswith(".pdf") or content.startswith(b"%PDF"):
+        try:
+            image = _render_pdf(content, digest)
+        except Exception as e:
+            logger.error(f"Ошибка растеризации PDF {name}: {str(e)}")
+            image = None
+    else:
+        image = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_COLOR)
+    return digest, image
+
+def _read_image(image_path: str):
+    """
+    Чтение изображения с вычислением хэша содержимого
+    
+    Args:
+        image_path: путь к изображению
+        
+    Returns:
+        tuple: SHA-256 содержимого файла и декодированное изображение
+            (None, None, если файл не удалось прочитать)
+    """
+    try:
+        with open(image_path, "rb") as f:
+            content = f.read()
+    except OSError:
+        return None, None
+    return decode_image(content, image_path)
+
 class InvoiceProcessor:
     def __init__(self,
                  detector_model_path: Optional[str] = None,
                  ocr_engine: str = 'easyocr',
                  google_credentials_path: Optional[str] = None,
-                 output_dir: str = "output"):
+                 output_dir: str = "output",
+                 use_tensorrt: bool = False,
+                 trt_precision: str = 'fp16',
+                 calibration_dir: Optional[str] = None,
+                 detection_cache_bits: Optional[int] = None):
         """
         Инициализация процессора счетов
         
@@ -36,14 +159,45 @@ class InvoiceProcessor:
             ocr_engine: 'easyocr' или 'google'
             google_credentials_path: путь к учетным данным Google Cloud
             output_dir: директория для сохранения результатов
+            use_tensorrt: выполнять детектор через TensorRT-движок
+            trt_precision: точность движка, 'fp16' или 'int8'
+            calibration_dir: изображения счетов для калибровки INT8
+            detection_cache_bits: порог pHash для кэша детекций по шаблону
+                счета (None - кэш выключен)
         """
-        self.detector = InvoiceDetector(model_path=detector_model_path)
+        # Параметры создания: по ним процессы-обработчики создают свои процессоры
+        self.init_args = {
+            "detector_model_path": detector_model_path,
+            "ocr_engine": ocr_engine,
+            "google_credentials_path": google_credentials_path,
+            "output_dir": output_dir,
+            "use_tensorrt": use_tensorrt,
+            "trt_precision": trt_precision,
+            "calibration_dir": calibration_dir,
+            "detection_cache_bits": detection_cache_bits
+        }
+        
+        self.detector = InvoiceDetector(
+            model_path=detector_model_path,
+            use_tensorrt=use_tensorrt,
+            trt_precision=trt_precision,
+            calibration_dir=calibration_dir,
+            cache_threshold_bits=detection_cache_bits
+        )
         self.ocr = OCRProcessor(
             ocr_engine=ocr_engine,
             google_credentials_path=google_credentials_path
         )
         self.table_parser = TableParser()
         
+        # OCR и парсинг не потокобезопасны: при вызовах из нескольких потоков
+        # выполняются по одному (блокировку берет _recognize, через который
+        # к ним приходят и process_invoice, и process_batch)
+        self.lock = threading.Lock()
+        
+        # Текущие настройки модели и OCR (обновляются интерфейсом)
+        self.config: Dict[str, Dict] = {"model": {}, "ocr": {}}
+        
         # Создаем директорию для результатов
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
@@ -59,7 +213,8 @@ class InvoiceProcessor:
     def process_invoice(self, 
                        image_path: str,
                        visualize: bool = False,
-                       save_results: bool = True) -> Dict:
+                       save_results: bool = True,
+                       image: Optional[np.ndarray] = None) -> Dict:
         """
         Обработка счета
         
@@ -67,14 +222,19 @@ class InvoiceProcessor:
             image_path: путь к изображению счета
             visualize: флаг визуализации результатов
             save_results: флаг сохранения результатов
+            image: уже декодированное изображение; если задано, файл
+                image_path не читается и используется только как имя
             
         Returns:
             dict: структурированные данные счета
         """
         logger.info(f"Начало обработки счета: {image_path}")
         
-        # Загрузка изображения
-        image = cv2.imread(image_path)
+        # Загрузка изображения; прочитанное здесь изображение больше никому
+        # не нужно, и визуализация рисуется прямо на нем
+        own_image = image is None
+        if own_image:
+            _, image = _read_image(image_path)
         if image is None:
             error_msg = f"Не удалось загрузить изображение: {image_path}"
             logger.error(error_msg)
@@ -84,30 +244,219 @@ class InvoiceProcessor:
         logger.info("Детекция областей счета")
         detections = self.detector.detect(image)
         
-        # Распознавание текста в каждой области
-        logger.info("Распознавание текста в областях")
+        return self._process_detections(image_path, image, detections, visualize, save_results,
+                                        draw_inplace=own_image)
+        
+    def process_batch(self,
+                      files: List[str],
+                      batch_size: int = 8,
+                      visualize: bool = False,
+                      save_results: bool = True,
+                      use_cache: bool = True,
+                      cancel_event=None) -> Dict[str, Dict]:
+        """
+        Обработка счетов пакетами: изображения пакета читаются параллельно,
+        детекция выполняется одним вызовом модели на весь пакет
+        
+        Args:
+            files: пути к изображениям счетов
+            batch_size: размер пакета для детектора
+            visualize: флаг визуализации результатов
+            save_results: флаг сохранения результатов
+            use_cache: использовать кэш результатов по содержимому файла
+            cancel_event: событие отмены (threading.Event или его прокси из
+                multiprocessing.Manager); проверяется перед каждым пакетом
+                и счетом, при отмене возвращаются уже готовые результаты
+            
+        Returns:
+            Dict[str, Dict]: результаты обработки для каждого счета
+        """
+        cache = _get_result_cache() if use_cache else None
+        config_hash = self._config_hash()
+        
         results = {}
-        for region_type, bbox in detections.items():
-            text = self.ocr.recognize(image, region=bbox)
-            results[region_type] = {
-                'text': text,
-                'bbox': bbox
-            }
+        chunks = [files[start:start + batch_size] for start in range(0, len(files), batch_size)]
+        with ThreadPoolExecutor(max_workers=min(batch_size, 8)) as pool:
+            # Следующий пакет читается с диска, пока идут детекция и OCR текущего
+            pending = [pool.submit(_read_image, image_path) for image_path in chunks[0]] if chunks else []
+            for index, chunk in enumerate(chunks):
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                reads = pending
+                if index + 1 < len(chunks):
+                    pending = [pool.submit(_read_image, image_path) for image_path in chunks[index + 1]]
+                    
+                # Загрузка изображений пакета; уже распознанные файлы берем из кэша
+                loaded = []
+                for image_path, read in zip(chunk, reads):
+                    digest, image = read.result()
+                    key = f"{digest}:{config_hash}:{RESULT_CACHE_VERSION}"
+                    entry = cache.get(key) if cache is not None and digest is not None else None
+                    if entry is not None:
+                        # Распознавание не повторяется, но результаты сохраняются
+                        # и визуализируются так же, как для новых файлов
+                        try:
+                            results[image_path] = self._output_results(
+                                image_path, image, entry["detections"], entry["results"],
+                                entry["structured_data"], visualize, save_results, draw_inplace=True
+                            )
+                        except Exception as e:
+                            logger.error(f"Ошибка при обработке {image_path}: {str(e)}")
+                            results[image_path] = {"error": str(e)}
+                    elif image is None:
+                        error_msg = f"Не удалось загрузить изображение: {image_path}"
+                        logger.error(error_msg)
+                        results[image_path] = {"error": error_msg}
+                    else:
+                        loaded.append((image_path, key, image))
+                        
+                # Детекция областей для всего пакета
+                logger.info(f"Детекция областей в пакете из {len(loaded)} счетов")
+                try:
+                    batch_detections = self.detector.detect_batch([image for _, _, image in loaded])
+                except Exception as e:
+                    # Ошибка детекции не прерывает обработку остальных пакетов
+                    logger.error(f"Ошибка детекции пакета: {str(e)}")
+                    for image_path, _, _ in loaded:
+                        results[image_path] = {"error": str(e)}
+                    continue
+                    
+                for (image_path, key, image), detections in zip(loaded, batch_detections):
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    try:
+                        raw_results, structured_data = self._recognize(image, detections)
+                        if cache is not None:
+                            cache[key] = {
+                                "detections": detections,
+                                "results": raw_results,
+                                "structured_data": structured_data
+                            }
+                        results[image_path] = self._output_results(
+                            image_path, image, detections, raw_results, structured_data,
+                            visualize, save_results, draw_inplace=True
+                        )
+                    except Exception as e:
+                        logger.error(f"Ошибка при обработке {image_path}: {str(e)}")
+                        results[image_path] = {"error": str(e)}
+                        
+        return results
+        
+    def update_config(self, settings: Dict):
+        """
+        Обновление настроек модели и OCR
+        
+        Точность детектора применяется здесь, один раз при изменении
+        настроек, а не при каждом вызове обработки.
+        
+        Args:
+            settings: настройки по разделам ("model", "ocr", ...)
+        """
+        self.config.update(settings)
+        self.detector.set_precision(self.config["model"].get("precision", "fp32"))
+        
+    def _config_hash(self) -> str:
+        """Хэш настроек модели и OCR, влияющих на результат распознавания"""
+        config = {"model": self.config.get("model"), "ocr": self.config.get("ocr")}
+        return hashlib.blake2b(
+            json.dumps(config, sort_keys=True).encode()
+        ).hexdigest()[:16]
+        
+    def _process_detections(self,
+                            image_path: str,
+                            image: np.ndarray,
+                            detections: Dict[str, List[int]],
+                            visualize: bool,
+                            save_results: bool,
+                            draw_inplace: bool = False) -> Dict:
+        """
+        Распознавание, парсинг и сохранение результатов по найденным областям
+        
+        Args:
+            image_path: путь к изображению счета
+            image: изображение счета
+            detections: найденные области
+            visualize: флаг визуализации результатов
+            save_results: флаг сохранения результатов
+            draw_inplace: рисовать визуализацию на самом image, без копии
             
-        # Парсинг таблицы товаров
-        if 'items_table' in results:
-            logger.info("Парсинг таблицы товаров")
-            items = self.table_parser.parse_table(
-                image, 
-                results['items_table']['bbox'],
-                results['items_table']['text']
-            )
-            results['items_table']['parsed_items'] = items
+        Returns:
+            dict: структурированные данные счета
+        """
+        results, structured_data = self._recognize(image, detections)
+        return self._output_results(image_path, image, detections, results, structured_data,
+                                    visualize, save_results, draw_inplace)
+        
+    def _recognize(self, image: np.ndarray, detections: Dict[str, List[int]]):
+        """
+        Распознавание текста и парсинг таблицы по найденным областям
+        
+        Args:
+            image: изображение счета
+            detections: найденные области
+            
+        Returns:
+            tuple: результаты распознавания по областям и структурированные данные
+        """
+        # Распознавание текста в каждой области
+        logger.info("Распознавание текста в областях")
+        min_area = self.config["ocr"].get("min_area", MIN_OCR_AREA)
+        regions = {
+            region_type: bbox for region_type, bbox in detections.items()
+            if region_type not in OCR_SKIP_REGIONS
+            and (bbox[2] - bbox[0]) * (bbox[3] - bbox[1]) >= min_area
+        }
+        with self.lock:
+            texts = self.ocr.recognize_regions(image, regions)
+            results = {}
+            for region_type, bbox in regions.items():
+                results[region_type] = {
+                    'text': texts[region_type],
+                    'bbox': bbox
+                }
+                
+            # Парсинг таблицы товаров
+            if 'items_table' in results:
+                logger.info("Парсинг таблицы товаров")
+                items = self.table_parser.parse_table(
+                    image, 
+                    results['items_table']['bbox'],
+                    results['items_table']['text']
+                )
+                results['items_table']['parsed_items'] = items
+                
+        # Извлечение структурированных данных
+        return results, self.extract_structured_data(results)
+        
+    def _output_results(self,
+                        image_path: str,
+                        image: Optional[np.ndarray],
+                        detections: Dict[str, List[int]],
+                        results: Dict,
+                        structured_data: Dict,
+                        visualize: bool,
+                        save_results: bool,
+                        draw_inplace: bool = False) -> Dict:
+        """
+        Визуализация и сохранение результатов распознавания
+        
+        Args:
+            image_path: путь к изображению счета
+            image: изображение счета (None - без визуализации)
+            detections: найденные области
+            results: результаты распознавания по областям
+            structured_data: структурированные данные
+            visualize: флаг визуализации результатов
+            save_results: флаг сохранения результатов
+            draw_inplace: рисовать визуализацию на самом image, без копии
             
+        Returns:
+            dict: структурированные данные счета
+        """
         # Визуализация результатов
-        if visualize:
+        if visualize and image is not None:
             logger.info("Визуализация результатов")
-            vis_image = self.detector.visualize_detections(image, detections)
+            vis_image = self.detector.visualize_detections(image, detections, inplace=draw_inplace)
             
             # Сохраняем визуализацию
             if save_results:
@@ -116,9 +465,6 @@ class InvoiceProcessor:
                 cv2.imwrite(str(vis_path), vis_image)
                 results['visualization_path'] = str(vis_path)
                 
-        # Извлечение структурированных данных
-        structured_data = self.extract_structured_data(results)
-        
         # Сохранение результатов
         if save_results:
             self._save_results(image_path, structured_data, results)
@@ -149,30 +495,13 @@ class InvoiceProcessor:
             'payment_info': None
         }
         
-        # Извлечение номера счета
-        if 'invoice_number' in results:
-            structured_data['invoice_number'] = results['invoice_number']['text']
-            
-        # Извлечение даты
-        if 'date' in results:
-            structured_data['date'] = results['date']['text']
-            
-        # Извлечение общей суммы
-        if 'total_amount' in results:
-            structured_data['total_amount'] = results['total_amount']['text']
-            
-        # Извлечение информации о поставщике
-        if 'supplier_name' in results:
-            structured_data['supplier']['name'] = results['supplier_name']['text']
-        if 'inn' in results:
-            structured_data['supplier']['inn'] = results['inn']['text']
-        if 'address' in results:
-            structured_data['supplier']['address'] = results['address']['text']
-            
-        # Извлечение платежной информации
-        if 'payment_info' in results:
-            structured_data['payment_info'] = results['payment_info']['text']
-            
+        # Текстовые поля по таблице STRUCTURED_FIELDS
+        for section, key, region_type in STRUCTURED_FIELDS:
+            region = results.get(region_type)
+            if region is not None:
+                target = structured_data[section] if section else structured_data
+                target[key] = region['text']
+                
         # Извлечение таблицы товаров
         if 'items_table' in results and 'parsed_items' in results['items_table']:
             structured_data['items'] = results['items_table']['parsed_items']
@@ -193,25 +522,28 @@ class InvoiceProcessor:
         
         # Сохраняем структурированные данные
         json_path = self.json_dir / f"{base_name}_{timestamp}.json"
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                'structured_data': structured_data,
-                'raw_results': raw_results,
-                'processing_time': timestamp,
-                'source_image': image_path
-            }, f, ensure_ascii=False, indent=2)
-            
+        json_path.write_bytes(orjson.dumps({
+            'structured_data': structured_data,
+            'raw_results': raw_results,
+            'processing_time': timestamp,
+            'source_image': image_path
+        }, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        
         logger.info(f"Результаты сохранены: {json_path}")
         
     def batch_process(self, 
                      image_dir: str, 
-                     visualize: bool = False) -> Dict[str, Dict]:
+                     visualize: bool = False,
+                     num_workers: int = 1,
+                     batch_size: int = 8) -> Dict[str, Dict]:
         """
         Пакетная обработка счетов
         
         Args:
             image_dir: директория с изображениями счетов
             visualize: флаг визуализации результатов
+            num_workers: число процессов-обработчиков (1 - в текущем процессе)
+            batch_size: размер пакета файлов
             
         Returns:
             Dict[str, Dict]: результаты обработки для каждого счета
@@ -220,16 +552,49 @@ class InvoiceProcessor:
         if not image_dir.exists():
             raise ValueError(f"Директория не существует: {image_dir}")
             
+        # Файлы обрабатываются пакетами: чтение с диска параллельно и с
+        # опережением, детекция - одним вызовом модели на пакет
+        files = sorted(str(image_path) for image_path in image_dir.glob("*.jpg"))
+        num_workers = min(num_workers, os.cpu_count() or 1, -(-len(files) // batch_size))
+        if num_workers <= 1:
+            return self.process_batch(files, batch_size, visualize=visualize, use_cache=False)
+            
+        # Пакеты распределяются по процессам, у каждого свои модели; spawn -
+        # чтобы CUDA инициализировалась в дочерних процессах заново
+        chunks = [files[start:start + batch_size] for start in range(0, len(files), batch_size)]
         results = {}
-        for image_path in image_dir.glob("*.jpg"):
-            try:
-                result = self.process_invoice(
-                    str(image_path),
-                    visualize=visualize
-                )
-                results[str(image_path)] = result
-            except Exception as e:
-                logger.error(f"Ошибка при обработке {image_path}: {str(e)}")
-                results[str(image_path)] = {"error": str(e)}
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker_process,
+            initargs=(self.init_args, self.config)
+        ) as pool:
+            for chunk_results in pool.map(_process_batch_in_worker, chunks, repeat(batch_size), repeat(visualize)):
+                results.update(chunk_results)
                 
-        return results 
\ No newline at end of file
+        return results
+        
+# Процессор процесса-обработчика batch_process
+_worker_processor: Optional[InvoiceProcessor] = None
+
+def _init_worker_process(init_args: Dict, config: Dict):
+    """Инициализация процесса-обработчика: у каждого процесса свой процессор"""
+    global _worker_processor
+    _worker_processor = InvoiceProcessor(**init_args)
+    _worker_processor.update_config(config)
+    
+def _process_batch_in_worker(files: List[str], batch_size: int, visualize: bool) -> Dict[str, Dict]:
+    """Обработка пакета файлов в процессе-обработчике"""
+    return _worker_processor.process_batch(files, batch_size, visualize=visualize, use_cache=False)
+
+@lru_cache(maxsize=1)
+def get_processor() -> InvoiceProcessor:
+    """
+    Общий экземпляр процессора счетов
+    
+    Модели загружаются при первом обращении, а не при импорте модуля.
+    
+    Returns:
+        InvoiceProcessor: процессор счетов
+    """
+    return InvoiceProcessor()
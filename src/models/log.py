@@ -1,13 +1,35 @@
 import logging
-from typing import Dict, Any, Optional, List, Union
+import sys
+from typing import Dict, Any, Optional, List, Union, BinaryIO
 from pathlib import Path
-import json
+import os
 import time
-from dataclasses import dataclass, asdict
+import atexit
+import threading
+import bisect
+import heapq
+from operator import attrgetter
+from collections import Counter
+from dataclasses import dataclass
+
+import orjson
 
 logger = logging.getLogger("Log")
 
-@dataclass
+# Записи модуля хранятся в {module}.jsonl, по строке JSON на запись;
+# файлы {module}.json (весь лог одним массивом) читаются для миграции
+LOG_SUFFIX = ".jsonl"
+LEGACY_SUFFIX = ".json"
+
+# Новые записи накапливаются и пишутся одной порцией через FLUSH_INTERVAL
+# секунд или сразу, когда набралось FLUSH_MAX_PENDING записей
+FLUSH_INTERVAL = 0.25
+FLUSH_MAX_PENDING = 1000
+
+# На Python 3.10+ записи хранятся в слотах, без __dict__ на каждый экземпляр
+DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**DATACLASS_SLOTS)
 class LogEntry:
     id: str
     level: str
@@ -31,8 +53,27 @@ class Log:
         
         self.logs: Dict[str, List[LogEntry]] = {}
         
+        # Время записей каждого модуля по возрастанию (записи в self.logs
+        # в том же порядке): диапазоны времени ищутся бинарным поиском
+        self.timestamps: Dict[str, List[float]] = {}
+        
+        # Число записей каждого уровня по модулям, для статистики без обхода записей
+        self.level_counts: Dict[str, Counter] = {}
+        
+        # Открытые на дозапись файлы модулей
+        self.files: Dict[str, BinaryIO] = {}
+        
+        # Добавленные, но еще не записанные в файлы записи
+        self.lock = threading.RLock()
+        self.pending: Dict[str, List[LogEntry]] = {}
+        self.pending_count = 0
+        self.flush_timer: Optional[threading.Timer] = None
+        
         # Загружаем логи
         self._load_logs()
+        for module in self.logs:
+            self._index(module)
+        atexit.register(self.close)
         
         logger.info("Инициализирован менеджер логов")
         
@@ -41,14 +82,33 @@ class Log:
         Загрузка логов из файлов
         """
         try:
-            # Загружаем логи из файлов
-            for log_file in self.log_dir.glob("*.json"):
+            # Загружаем логи из файлов построчно
+            for log_file in self.log_dir.glob(f"*{LOG_SUFFIX}"):
+                module = log_file.stem
+                entries = self.logs[module] = []
+                try:
+                    with open(log_file, "rb") as f:
+                        for line in f:
+                            try:
+                                entries.append(LogEntry(**orjson.loads(line)))
+                            except orjson.JSONDecodeError:
+                                # Недописанная строка в конце файла после сбоя
+                                logger.error(f"Пропущена поврежденная запись лога {log_file}")
+                                
+                except Exception as e:
+                    logger.error(f"Ошибка загрузки логов {log_file}: {str(e)}")
+                    
+            # Логи в старом формате переносятся в JSONL
+            for log_file in self.log_dir.glob(f"*{LEGACY_SUFFIX}"):
+                module = log_file.stem
+                if module in self.logs:
+                    continue
+                    
                 try:
-                    with open(log_file, "r", encoding="utf-8") as f:
-                        data = json.load(f)
+                    with open(log_file, "rb") as f:
+                        data = orjson.loads(f.read())
                         
                     # Создаем логи
-                    module = log_file.stem
                     self.logs[module] = []
                     
                     # Загружаем записи
@@ -65,15 +125,121 @@ class Log:
                         )
                         self.logs[module].append(entry)
                         
+                    self._save_log(module)
+                    
                 except Exception as e:
                     logger.error(f"Ошибка загрузки логов {log_file}: {str(e)}")
                     
         except Exception as e:
             logger.error(f"Ошибка загрузки логов: {str(e)}")
             
+    def _index(self, module: str) -> None:
+        """
+        Упорядочивание записей модуля по времени и построение индекса
+        
+        Args:
+            module: название модуля
+        """
+        entries = self.logs[module]
+        entries.sort(key=attrgetter("timestamp"))
+        self.timestamps[module] = [entry.timestamp for entry in entries]
+        self.level_counts[module] = Counter(entry.level for entry in entries)
+        
+    def _range(self, module: str, start_time: Optional[float], end_time: Optional[float]) -> List[LogEntry]:
+        """
+        Записи модуля в диапазоне времени
+        
+        Args:
+            module: название модуля
+            start_time: начальное время (включительно)
+            end_time: конечное время (включительно)
+            
+        Returns:
+            List[LogEntry]: записи по возрастанию времени
+        """
+        timestamps = self.timestamps[module]
+        start = 0 if start_time is None else bisect.bisect_left(timestamps, start_time)
+        end = len(timestamps) if end_time is None else bisect.bisect_right(timestamps, end_time)
+        return self.logs[module][start:end]
+        
+    def _clear_module(self, module: str, before_time: Optional[float]) -> None:
+        """
+        Удаление записей модуля из памяти
+        
+        Args:
+            module: название модуля
+            before_time: удалить записи до этого времени (None - все)
+        """
+        with self.lock:
+            if before_time is None:
+                self.logs[module] = []
+                self.timestamps[module] = []
+                self.level_counts[module] = Counter()
+            else:
+                start = bisect.bisect_left(self.timestamps[module], before_time)
+                self.level_counts[module] -= Counter(entry.level for entry in self.logs[module][:start])
+                self.logs[module] = self.logs[module][start:]
+                self.timestamps[module] = self.timestamps[module][start:]
+            
+    def _file(self, module: str) -> BinaryIO:
+        """
+        Файл модуля, открытый на дозапись
+        
+        Args:
+            module: название модуля
+            
+        Returns:
+            BinaryIO: файл
+        """
+        f = self.files.get(module)
+        if f is None:
+            f = self.files[module] = open(self.log_dir / f"{module}{LOG_SUFFIX}", "ab")
+        return f
+        
+    def _schedule_flush(self) -> None:
+        """
+        Планирование записи накопленных записей
+        """
+        with self.lock:
+            if self.pending_count >= FLUSH_MAX_PENDING:
+                self.flush()
+            elif self.flush_timer is None:
+                self.flush_timer = threading.Timer(FLUSH_INTERVAL, self.flush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+                
+    def flush(self) -> bool:
+        """
+        Запись накопленных записей: по одной операции записи на модуль
+        
+        Returns:
+            bool: успешность записи
+        """
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+                
+            pending, self.pending = self.pending, {}
+            self.pending_count = 0
+            
+            success = True
+            for module, entries in pending.items():
+                try:
+                    f = self._file(module)
+                    f.write(b"".join(orjson.dumps(entry) + b"\n" for entry in entries))
+                    f.flush()
+                except Exception as e:
+                    logger.error(f"Ошибка сохранения логов {module}: {str(e)}")
+                    success = False
+                    
+            return success
+            
     def _save_log(self, module: str) -> bool:
         """
-        Сохранение логов в файл
+        Перезапись файла модуля текущими записями
+        
+        Файл пишется во временный и атомарно заменяет старый.
         
         Args:
             module: название модуля
@@ -82,12 +248,21 @@ class Log:
             bool: успешность сохранения
         """
         try:
-            # Создаем файл
-            log_file = self.log_dir / f"{module}.json"
-            
-            # Сохраняем данные
-            with open(log_file, "w", encoding="utf-8") as f:
-                json.dump([asdict(entry) for entry in self.logs[module]], f, ensure_ascii=False, indent=2)
+            with self.lock:
+                # Файл пишется из памяти целиком, включая еще не записанные записи
+                pending = self.pending.pop(module, None)
+                if pending:
+                    self.pending_count -= len(pending)
+                    
+                log_file = self.log_dir / f"{module}{LOG_SUFFIX}"
+                tmp_file = log_file.with_name(log_file.name + ".tmp")
+                with open(tmp_file, "wb") as f:
+                    f.write(b"".join(orjson.dumps(entry) + b"\n" for entry in self.logs[module]))
+                    
+                f = self.files.pop(module, None)
+                if f is not None:
+                    f.close()
+                os.replace(tmp_file, log_file)
                 
             return True
             
@@ -95,6 +270,16 @@ class Log:
             logger.error(f"Ошибка сохранения логов {module}: {str(e)}")
             return False
             
+    def close(self) -> None:
+        """
+        Запись накопленных записей и закрытие файлов логов
+        """
+        with self.lock:
+            self.flush()
+            for f in self.files.values():
+                f.close()
+            self.files.clear()
+            
     def add_log(self, level: str, message: str, module: str, function: str, line: int, metadata: Optional[Dict[str, Any]] = None) -> bool:
         """
         Добавление записи в лог
@@ -123,14 +308,26 @@ class Log:
                 metadata=metadata
             )
             
-            # Добавляем запись
-            if module not in self.logs:
-                self.logs[module] = []
+            with self.lock:
+                # Добавляем запись
+                entries = self.logs.setdefault(module, [])
+                timestamps = self.timestamps.setdefault(module, [])
+                if timestamps and entry.timestamp < timestamps[-1]:
+                    # Часы переведены назад: запись вставляется по порядку времени
+                    index = bisect.bisect_right(timestamps, entry.timestamp)
+                    timestamps.insert(index, entry.timestamp)
+                    entries.insert(index, entry)
+                else:
+                    timestamps.append(entry.timestamp)
+                    entries.append(entry)
+                self.level_counts.setdefault(module, Counter())[level] += 1
                 
-            self.logs[module].append(entry)
-            
-            # Сохраняем логи
-            return self._save_log(module)
+                # Запись в файл откладывается: частые записи пишутся одной порцией
+                self.pending.setdefault(module, []).append(entry)
+                self.pending_count += 1
+                self._schedule_flush()
+                
+            return True
             
         except Exception as e:
             logger.error(f"Ошибка добавления записи в лог: {str(e)}")
@@ -150,28 +347,23 @@ class Log:
             List[LogEntry]: записи лога
         """
         try:
-            # Получаем записи
-            entries = []
-            
+            # Получаем записи диапазона времени
             if module is not None:
                 if module not in self.logs:
                     return []
                     
-                entries = self.logs[module]
+                entries = self._range(module, start_time, end_time)
             else:
-                for module_logs in self.logs.values():
-                    entries.extend(module_logs)
-                    
+                # Срезы модулей сливаются в общий порядок по времени
+                entries = list(heapq.merge(
+                    *(self._range(module, start_time, end_time) for module in self.logs),
+                    key=attrgetter("timestamp")
+                ))
+                
             # Фильтруем записи
             if level is not None:
                 entries = [entry for entry in entries if entry.level == level]
                 
-            if start_time is not None:
-                entries = [entry for entry in entries if entry.timestamp >= start_time]
-                
-            if end_time is not None:
-                entries = [entry for entry in entries if entry.timestamp <= end_time]
-                
             return entries
             
         except Exception as e:
@@ -194,19 +386,11 @@ class Log:
                 if module not in self.logs:
                     return True
                     
-                if before_time is not None:
-                    self.logs[module] = [entry for entry in self.logs[module] if entry.timestamp >= before_time]
-                else:
-                    self.logs[module] = []
-                    
+                self._clear_module(module, before_time)
                 return self._save_log(module)
                 
             for module in list(self.logs.keys()):
-                if before_time is not None:
-                    self.logs[module] = [entry for entry in self.logs[module] if entry.timestamp >= before_time]
-                else:
-                    self.logs[module] = []
-                    
+                self._clear_module(module, before_time)
                 self._save_log(module)
                 
             return True
@@ -223,24 +407,17 @@ class Log:
             Dict[str, int]: статистика
         """
         try:
-            stats = {
+            # Уровни складываются из счетчиков модулей, записи не обходятся
+            levels = Counter()
+            for counts in self.level_counts.values():
+                levels.update(counts)
+                
+            return {
                 "total": sum(len(logs) for logs in self.logs.values()),
-                "modules": {},
-                "levels": {}
+                "modules": {module: len(logs) for module, logs in self.logs.items()},
+                "levels": dict(levels)
             }
             
-            # Считаем количество записей по модулям и уровням
-            for module, logs in self.logs.items():
-                stats["modules"][module] = len(logs)
-                
-                for entry in logs:
-                    if entry.level not in stats["levels"]:
-                        stats["levels"][entry.level] = 0
-                        
-                    stats["levels"][entry.level] += 1
-                    
-            return stats
-            
         except Exception as e:
             logger.error(f"Ошибка получения статистики логов: {str(e)}")
             return {} 
\ No newline at end of file
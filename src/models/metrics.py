@@ -1,23 +1,170 @@
-from typing import Dict, List, Union, Optional, Any
+from typing import Dict, List, Union, Optional, Any, BinaryIO
 import numpy as np
 from datetime import datetime
-import json
 import logging
 from pathlib import Path
+from collections import OrderedDict
+from operator import itemgetter
+import os
+import atexit
 import threading
 import time
-from sklearn.metrics import precision_score, recall_score, f1_score
 from dataclasses import dataclass, asdict
 
+import orjson
+
 logger = logging.getLogger("Metrics")
 
+# Значения метрики хранятся в {metric}.jsonl, по строке JSON на значение;
+# файлы {metric}.json (вся история одним объектом) читаются для миграции
+METRIC_SUFFIX = ".jsonl"
+LEGACY_SUFFIX = ".json"
+
+# Начальная емкость массивов значений метрики, при заполнении удваивается
+SERIES_CAPACITY = 64
+
+# Число запомненных результатов get_metric_stats
+STATS_CACHE_SIZE = 4096
+
 @dataclass
 class MetricValue:
     """Значение метрики"""
     value: float
-    timestamp: float = time.time()
+    # Время задается при создании: значение по умолчанию вычислялось бы
+    # один раз при определении класса
+    timestamp: float
     metadata: Optional[Dict[str, Any]] = None
 
+def _stats(values: np.ndarray) -> Dict[str, float]:
+    """
+    Статистика значений метрики
+    
+    Args:
+        values: непрерывный срез значений ряда
+        
+    Returns:
+        Dict[str, float]: минимум, максимум, среднее и количество
+    """
+    count = values.size
+    if not count:
+        return {
+            "min": 0.0,
+            "max": 0.0,
+            "avg": 0.0,
+            "count": 0
+        }
+        
+    # Среднее считается из суммы, без отдельного прохода np.mean
+    return {
+        "min": float(np.minimum.reduce(values)),
+        "max": float(np.maximum.reduce(values)),
+        "avg": float(np.add.reduce(values)) / count,
+        "count": count
+    }
+
+class MetricSeries:
+    """
+    Значения метрики: массивы значений и времени по возрастанию времени,
+    метаданные - отдельным списком
+    """
+    
+    def __init__(self, capacity: int = SERIES_CAPACITY):
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.timestamps = np.empty(capacity, dtype=np.float64)
+        self.metadata: List[Optional[Dict[str, Any]]] = []
+        self.size = 0
+        
+    @classmethod
+    def from_values(cls, values: List[MetricValue]) -> "MetricSeries":
+        """
+        Создание ряда из значений метрики
+        
+        Args:
+            values: значения метрики
+            
+        Returns:
+            MetricSeries: ряд, упорядоченный по времени
+        """
+        series = cls(max(len(values), SERIES_CAPACITY))
+        series.size = len(values)
+        series.values[:series.size] = [value.value for value in values]
+        series.timestamps[:series.size] = [value.timestamp for value in values]
+        
+        order = np.argsort(series.timestamps[:series.size], kind="stable")
+        series.values[:series.size] = series.values[order]
+        series.timestamps[:series.size] = series.timestamps[order]
+        series.metadata = [values[i].metadata for i in order]
+        return series
+        
+    def __len__(self) -> int:
+        return self.size
+        
+    def append(self, value: float, timestamp: float, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Добавление значения
+        
+        Args:
+            value: значение
+            timestamp: время
+            metadata: дополнительные данные
+        """
+        if self.size == len(self.values):
+            capacity = max(2 * self.size, SERIES_CAPACITY)
+            self.values = np.resize(self.values, capacity)
+            self.timestamps = np.resize(self.timestamps, capacity)
+            
+        n = self.size
+        if n and timestamp < self.timestamps[n - 1]:
+            # Часы переведены назад: значение вставляется по порядку времени
+            index = int(np.searchsorted(self.timestamps[:n], timestamp, side="right"))
+            self.values[index + 1:n + 1] = self.values[index:n]
+            self.timestamps[index + 1:n + 1] = self.timestamps[index:n]
+            self.metadata.insert(index, metadata)
+        else:
+            index = n
+            self.metadata.append(metadata)
+            
+        self.values[index] = value
+        self.timestamps[index] = timestamp
+        self.size += 1
+        
+    def range(self, start_time: Optional[float] = None, end_time: Optional[float] = None) -> slice:
+        """
+        Индексы значений в диапазоне времени (бинарный поиск)
+        
+        Args:
+            start_time: начальное время (включительно)
+            end_time: конечное время (включительно)
+            
+        Returns:
+            slice: срез массивов ряда
+        """
+        timestamps = self.timestamps[:self.size]
+        start = 0 if start_time is None else int(np.searchsorted(timestamps, start_time, side="left"))
+        end = self.size if end_time is None else int(np.searchsorted(timestamps, end_time, side="right"))
+        return slice(start, max(start, end))
+        
+    def items(self, start_time: Optional[float] = None, end_time: Optional[float] = None) -> List[MetricValue]:
+        """
+        Значения в диапазоне времени
+        
+        Args:
+            start_time: начальное время (включительно)
+            end_time: конечное время (включительно)
+            
+        Returns:
+            List[MetricValue]: значения метрики
+        """
+        index = self.range(start_time, end_time)
+        return [
+            MetricValue(value=value, timestamp=timestamp, metadata=metadata)
+            for value, timestamp, metadata in zip(
+                self.values[index].tolist(),
+                self.timestamps[index].tolist(),
+                self.metadata[index]
+            )
+        ]
+
 class Metrics:
     def __init__(self, metrics_dir: Union[str, Path] = "data/metrics"):
         """
@@ -29,9 +176,20 @@ class Metrics:
         self.metrics_dir = Path(metrics_dir)
         self.metrics_dir.mkdir(parents=True, exist_ok=True)
         
+        # Открытые на дозапись файлы метрик
+        self.files: Dict[str, BinaryIO] = {}
+        self.lock = threading.Lock()
+        
         # Загружаем метрики
-        self.metrics: Dict[str, List[MetricValue]] = {}
+        self.metrics: Dict[str, MetricSeries] = {}
+        
+        # Версия метрики растет с каждым изменением; статистика запоминается
+        # по (метрика, срез значений, версия) и устаревает вместе с версией
+        self.versions: Dict[str, int] = {}
+        self.stats_cache: OrderedDict = OrderedDict()
+        
         self._load_metrics()
+        atexit.register(self.close)
         
         logger.info("Инициализирован менеджер метрик")
         
@@ -43,11 +201,30 @@ class Metrics:
             # Очищаем список метрик
             self.metrics.clear()
             
-            # Загружаем метрики из файлов
-            for metric_file in self.metrics_dir.glob("*.json"):
+            # Загружаем метрики из файлов построчно
+            for metric_file in self.metrics_dir.glob(f"*{METRIC_SUFFIX}"):
+                values = []
+                try:
+                    with open(metric_file, "rb") as f:
+                        for line in f:
+                            try:
+                                values.append(MetricValue(**orjson.loads(line)))
+                            except orjson.JSONDecodeError:
+                                # Недописанная строка в конце файла после сбоя
+                                logger.error(f"Пропущено поврежденное значение метрики в {metric_file}")
+                                
+                    self.metrics[metric_file.stem] = MetricSeries.from_values(values)
+                    
+                except Exception as e:
+                    logger.error(f"Ошибка загрузки метрики из {metric_file}: {str(e)}")
+                    
+            # Метрики в старом формате переносятся в JSONL
+            for metric_file in self.metrics_dir.glob(f"*{LEGACY_SUFFIX}"):
+                if metric_file.stem in self.metrics:
+                    continue
+                    
                 try:
-                    with open(metric_file, "r", encoding="utf-8") as f:
-                        metric_data = json.load(f)
+                    metric_data = orjson.loads(metric_file.read_bytes())
                         
                     # Создаем список значений
                     values = []
@@ -59,7 +236,8 @@ class Metrics:
                         ))
                         
                     # Добавляем метрику
-                    self.metrics[metric_file.stem] = values
+                    self.metrics[metric_file.stem] = MetricSeries.from_values(values)
+                    self._save_metric(metric_file.stem)
                     
                 except Exception as e:
                     logger.error(f"Ошибка загрузки метрики из {metric_file}: {str(e)}")
@@ -67,9 +245,26 @@ class Metrics:
         except Exception as e:
             logger.error(f"Ошибка загрузки метрик: {str(e)}")
             
+    def _file(self, metric_name: str) -> BinaryIO:
+        """
+        Файл метрики, открытый на дозапись
+        
+        Args:
+            metric_name: название метрики
+            
+        Returns:
+            BinaryIO: файл
+        """
+        f = self.files.get(metric_name)
+        if f is None:
+            f = self.files[metric_name] = open(self.metrics_dir / f"{metric_name}{METRIC_SUFFIX}", "ab")
+        return f
+        
     def _save_metric(self, metric_name: str) -> bool:
         """
-        Сохранение метрики в файл
+        Перезапись файла метрики всеми ее значениями
+        
+        Файл пишется во временный и атомарно заменяет старый.
         
         Args:
             metric_name: название метрики
@@ -78,21 +273,16 @@ class Metrics:
             bool: успешность сохранения
         """
         try:
-            # Создаем файл метрики
-            metric_file = self.metrics_dir / f"{metric_name}.json"
-            
-            # Сохраняем метрику
-            with open(metric_file, "w", encoding="utf-8") as f:
-                json.dump({
-                    "values": [
-                        {
-                            "value": value.value,
-                            "timestamp": value.timestamp,
-                            "metadata": value.metadata
-                        }
-                        for value in self.metrics[metric_name]
-                    ]
-                }, f, ensure_ascii=False, indent=2)
+            with self.lock:
+                metric_file = self.metrics_dir / f"{metric_name}{METRIC_SUFFIX}"
+                tmp_file = metric_file.with_name(metric_file.name + ".tmp")
+                with open(tmp_file, "wb") as f:
+                    f.write(b"".join(orjson.dumps(value) + b"\n" for value in self.metrics[metric_name].items()))
+                    
+                f = self.files.pop(metric_name, None)
+                if f is not None:
+                    f.close()
+                os.replace(tmp_file, metric_file)
                 
             return True
             
@@ -115,17 +305,24 @@ class Metrics:
         try:
             # Создаем значение
             metric_value = MetricValue(
-                value=value,
+                value=float(value),
+                timestamp=time.time(),
                 metadata=metadata
             )
             
-            # Добавляем значение
-            if metric_name not in self.metrics:
-                self.metrics[metric_name] = []
-            self.metrics[metric_name].append(metric_value)
-            
-            # Сохраняем метрику
-            return self._save_metric(metric_name)
+            with self.lock:
+                # Добавляем значение
+                if metric_name not in self.metrics:
+                    self.metrics[metric_name] = MetricSeries()
+                self.metrics[metric_name].append(metric_value.value, metric_value.timestamp, metadata)
+                self.versions[metric_name] = self.versions.get(metric_name, 0) + 1
+                
+                # Дописываем значение в конец файла, не переписывая историю
+                f = self._file(metric_name)
+                f.write(orjson.dumps(metric_value) + b"\n")
+                f.flush()
+                
+            return True
             
         except Exception as e:
             logger.error(f"Ошибка добавления метрики {metric_name}: {str(e)}")
@@ -144,17 +341,12 @@ class Metrics:
             List[MetricValue]: значения метрики
         """
         try:
-            # Получаем значения
-            values = self.metrics.get(metric_name, [])
-            
-            # Фильтруем по времени
-            if start_time is not None:
-                values = [value for value in values if value.timestamp >= start_time]
-                
-            if end_time is not None:
-                values = [value for value in values if value.timestamp <= end_time]
+            series = self.metrics.get(metric_name)
+            if series is None:
+                return []
                 
-            return values
+            # Значения упорядочены по времени: диапазон ищется бинарным поиском
+            return series.items(start_time, end_time)
             
         except Exception as e:
             logger.error(f"Ошибка получения метрики {metric_name}: {str(e)}")
@@ -173,24 +365,26 @@ class Metrics:
             Dict[str, float]: статистика
         """
         try:
-            # Получаем значения
-            values = self.get_metric(metric_name, start_time, end_time)
-            
-            if not values:
-                return {
-                    "min": 0.0,
-                    "max": 0.0,
-                    "avg": 0.0,
-                    "count": 0
-                }
-                
-            # Считаем статистику
-            return {
-                "min": min(value.value for value in values),
-                "max": max(value.value for value in values),
-                "avg": sum(value.value for value in values) / len(values),
-                "count": len(values)
-            }
+            with self.lock:
+                # Получаем значения: срез массива без копирования
+                series = self.metrics.get(metric_name)
+                if series is None:
+                    return _stats(np.empty(0))
+                    
+                # Ключ - границы среза, а не время: запросы "до текущего
+                # момента" попадают в кэш, пока новых значений нет
+                index = series.range(start_time, end_time)
+                key = (metric_name, index.start, index.stop, self.versions.get(metric_name, 0))
+                stats = self.stats_cache.get(key)
+                if stats is None:
+                    # Считаем статистику
+                    stats = self.stats_cache[key] = _stats(series.values[index])
+                    if len(self.stats_cache) > STATS_CACHE_SIZE:
+                        self.stats_cache.popitem(last=False)
+                else:
+                    self.stats_cache.move_to_end(key)
+                    
+                return dict(stats)
             
         except Exception as e:
             logger.error(f"Ошибка получения статистики метрики {metric_name}: {str(e)}")
@@ -212,14 +406,20 @@ class Metrics:
             bool: успешность очистки
         """
         try:
-            # Удаляем файл метрики
-            metric_file = self.metrics_dir / f"{metric_name}.json"
-            if metric_file.exists():
-                metric_file.unlink()
-                
-            # Удаляем метрику
-            if metric_name in self.metrics:
-                del self.metrics[metric_name]
+            with self.lock:
+                # Удаляем файлы метрики
+                f = self.files.pop(metric_name, None)
+                if f is not None:
+                    f.close()
+                for suffix in (METRIC_SUFFIX, LEGACY_SUFFIX):
+                    metric_file = self.metrics_dir / f"{metric_name}{suffix}"
+                    if metric_file.exists():
+                        metric_file.unlink()
+                        
+                # Удаляем метрику
+                if metric_name in self.metrics:
+                    del self.metrics[metric_name]
+                self.versions[metric_name] = self.versions.get(metric_name, 0) + 1
                 
             return True
             
@@ -227,6 +427,15 @@ class Metrics:
             logger.error(f"Ошибка очистки метрики {metric_name}: {str(e)}")
             return False
             
+    def close(self) -> None:
+        """
+        Закрытие файлов метрик
+        """
+        with self.lock:
+            for f in self.files.values():
+                f.close()
+            self.files.clear()
+            
     def get_metrics(self) -> List[str]:
         """
         Получение списка метрик
@@ -356,13 +565,13 @@ class MetricsCalculator:
         fn = 0
         
         # Создаем множества наименований
-        pred_names = {item['name'].lower() for item in predicted_items}
-        true_names = {item['name'].lower() for item in ground_truth_items}
+        pred_names = {name.lower() for name in map(itemgetter('name'), predicted_items)}
+        true_names = {name.lower() for name in map(itemgetter('name'), ground_truth_items)}
         
-        # Считаем TP, FP, FN
-        tp = len(pred_names.intersection(true_names))
-        fp = len(pred_names - true_names)
-        fn = len(true_names - pred_names)
+        # Считаем TP, FP, FN: одно пересечение, без построения разностей
+        tp = len(pred_names & true_names)
+        fp = len(pred_names) - tp
+        fn = len(true_names) - tp
         
         # Обновляем метрики
         self.metrics['items_table']['tp'] += tp
@@ -429,8 +638,7 @@ class MetricsCalculator:
         }
         
         filepath = self.output_dir / filename
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(metrics_data, f, ensure_ascii=False, indent=2)
+        filepath.write_bytes(orjson.dumps(metrics_data, option=orjson.OPT_INDENT_2))
             
         logger.info(f"Метрики сохранены в {filepath}")
         return str(filepath)
@@ -1,15 +1,101 @@
 import logging
-from typing import Dict, List, Optional, Union, Any
+from typing import Dict, List, Optional, Union, Any, BinaryIO, Tuple
 from pathlib import Path
-import json
+import os
+import atexit
+import bisect
+import threading
 import numpy as np
 from datetime import datetime
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.metrics import precision_recall_fscore_support
+from functools import lru_cache
+
+import orjson
 
 logger = logging.getLogger("MetricsMonitor")
 
+# Метрики, средние которых ведутся в сводке как average_{метрика}
+SUMMARY_METRICS = ("precision", "recall", "f1")
+
+# Новые записи дописываются в журнал {history}.jsonl; файл истории
+# переписывается целиком не чаще раза в SNAPSHOT_INTERVAL секунд или сразу,
+# когда в журнале набралось SNAPSHOT_MAX_PENDING записей
+JOURNAL_SUFFIX = ".jsonl"
+SNAPSHOT_INTERVAL = 1.0
+SNAPSHOT_MAX_PENDING = 64
+
+# Метрики из numpy приходят как числа numpy
+JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+def _epoch(timestamp: str) -> float:
+    """Время записи истории (ISO-строка) в секундах эпохи"""
+    return datetime.fromisoformat(timestamp).timestamp()
+
+@lru_cache(maxsize=1)
+def _plotting():
+    """
+    matplotlib и seaborn загружаются при первом построении графика, а не при
+    импорте модуля; графики только сохраняются в файлы, поэтому используется
+    неинтерактивный бэкенд Agg
+    
+    Returns:
+        tuple: модули pyplot и seaborn
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt, sns
+
+def _divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """Поэлементное деление, 0 при нулевом знаменателе"""
+    return np.divide(numerator, denominator, out=np.zeros(len(numerator)), where=denominator > 0)
+
+def _prf(y_true: List[Any], y_pred: List[Any], average: str = "weighted") -> Tuple[float, float, float]:
+    """
+    Precision, recall и F1 классификации (как precision_recall_fscore_support
+    из sklearn, без ее импорта)
+    
+    Args:
+        y_true: истинные значения
+        y_pred: предсказанные значения
+        average: тип усреднения: "binary" (класс 1), "micro", "macro" или "weighted"
+        
+    Returns:
+        Tuple[float, float, float]: precision, recall, F1
+    """
+    y_true = np.asarray(y_true)
+    y_pred = np.asarray(y_pred)
+    if y_true.shape != y_pred.shape:
+        raise ValueError(f"Разная длина y_true и y_pred: {len(y_true)} и {len(y_pred)}")
+        
+    # Номера классов по объединению меток
+    labels, classes = np.unique(np.concatenate([y_true, y_pred]), return_inverse=True)
+    true_classes, pred_classes = classes[:len(y_true)], classes[len(y_true):]
+    
+    # Число верных, предсказанных и истинных значений каждого класса
+    tp = np.bincount(true_classes[true_classes == pred_classes], minlength=len(labels))
+    predicted = np.bincount(pred_classes, minlength=len(labels))
+    actual = np.bincount(true_classes, minlength=len(labels))
+    
+    if average == "micro":
+        tp, predicted, actual = tp.sum(keepdims=True), predicted.sum(keepdims=True), actual.sum(keepdims=True)
+    elif average == "binary":
+        positive = labels == 1
+        tp, predicted, actual = tp[positive], predicted[positive], actual[positive]
+    elif average not in ("macro", "weighted"):
+        raise ValueError(f"Неподдерживаемый тип усреднения: {average}")
+        
+    precision = _divide(tp, predicted)
+    recall = _divide(tp, actual)
+    f1 = _divide(2 * precision * recall, precision + recall)
+    
+    if not len(tp):
+        return 0.0, 0.0, 0.0
+    if average == "weighted":
+        weights = actual / actual.sum() if actual.sum() else np.zeros(len(actual))
+        return float(precision @ weights), float(recall @ weights), float(f1 @ weights)
+    return float(precision.mean()), float(recall.mean()), float(f1.mean())
+
 class MetricsMonitor:
     def __init__(self,
                  output_dir: Union[str, Path] = "metrics",
@@ -25,8 +111,33 @@ class MetricsMonitor:
         self.output_dir.mkdir(parents=True, exist_ok=True)
         
         self.history_file = self.output_dir / history_file
+        self.journal_file = self.history_file.with_suffix(JOURNAL_SUFFIX)
         self.metrics_history = self._load_history()
         
+        # Журнал записей, еще не попавших в файл истории
+        self.lock = threading.RLock()
+        self.journal: Optional[BinaryIO] = None
+        self.pending = 0
+        self.snapshot_timer: Optional[threading.Timer] = None
+        
+        # Время записей метрик и ошибок по возрастанию (записи истории в том
+        # же порядке): диапазоны дат ищутся бинарным поиском, без разбора
+        # всех ISO-строк на каждый запрос
+        self.epochs: Dict[str, List[float]] = {}
+        for kind in ("metrics", "errors"):
+            self._index(kind)
+            
+        # Суммы метрик по всей истории: средние в сводке обновляются
+        # с каждой записью без обхода истории
+        self.sums = {name: 0.0 for name in SUMMARY_METRICS}
+        for entry in self.metrics_history["metrics"]:
+            for name in SUMMARY_METRICS:
+                self.sums[name] += entry["metrics"].get(name, 0.0)
+                
+        # Записи, добавленные после последнего сохранения истории
+        self._replay_journal()
+        atexit.register(self.close)
+        
         logger.info("Инициализирован монитор метрик")
         
     def _load_history(self) -> Dict:
@@ -38,8 +149,7 @@ class MetricsMonitor:
         """
         try:
             if self.history_file.exists():
-                with open(self.history_file, "r", encoding="utf-8") as f:
-                    return json.load(f)
+                return orjson.loads(self.history_file.read_bytes())
             return {
                 "metrics": [],
                 "errors": [],
@@ -65,19 +175,159 @@ class MetricsMonitor:
                 }
             }
             
+    def _replay_journal(self) -> None:
+        """
+        Применение к истории записей журнала и сохранение истории
+        """
+        if not self.journal_file.exists():
+            return
+            
+        try:
+            # Записи, уже попавшие в историю (сбой между сохранением истории
+            # и удалением журнала), не добавляются повторно
+            saved = {
+                kind: {entry["timestamp"] for entry in self.metrics_history[kind]}
+                for kind in ("metrics", "errors")
+            }
+            
+            with open(self.journal_file, "rb") as f:
+                for line in f:
+                    try:
+                        record = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        # Недописанная строка в конце файла после сбоя
+                        logger.error(f"Пропущена поврежденная запись журнала {self.journal_file}")
+                        continue
+                        
+                    kind, entry = record["kind"], record["entry"]
+                    if entry["timestamp"] in saved[kind]:
+                        continue
+                        
+                    self._append(kind, entry, _epoch(entry["timestamp"]))
+                    if kind == "metrics":
+                        self._update_summary(entry["metrics"])
+                    else:
+                        self.metrics_history["summary"]["total_errors"] += 1
+                        
+            self._save_history()
+            
+        except Exception as e:
+            logger.error(f"Ошибка загрузки журнала истории: {str(e)}")
+            
+    def _journal_entry(self, kind: str, entry: Dict) -> None:
+        """
+        Дозапись записи в журнал и планирование сохранения истории
+        
+        Args:
+            kind: "metrics" или "errors"
+            entry: запись
+        """
+        with self.lock:
+            if self.journal is None:
+                self.journal = open(self.journal_file, "ab")
+            self.journal.write(orjson.dumps({"kind": kind, "entry": entry}, option=JSON_OPTIONS) + b"\n")
+            self.journal.flush()
+            
+            self.pending += 1
+            if self.pending >= SNAPSHOT_MAX_PENDING:
+                self._save_history()
+            elif self.snapshot_timer is None:
+                self.snapshot_timer = threading.Timer(SNAPSHOT_INTERVAL, self._save_history)
+                self.snapshot_timer.daemon = True
+                self.snapshot_timer.start()
+                
     def _save_history(self) -> None:
         """
-        Сохранение истории метрик
+        Сохранение истории метрик и очистка журнала
+        
+        Файл пишется во временный и атомарно заменяет старый.
         """
         try:
-            with open(self.history_file, "w", encoding="utf-8") as f:
-                json.dump(self.metrics_history, f, ensure_ascii=False, indent=2)
+            with self.lock:
+                if self.snapshot_timer is not None:
+                    self.snapshot_timer.cancel()
+                    self.snapshot_timer = None
+                    
+                tmp_file = self.history_file.with_name(self.history_file.name + ".tmp")
+                tmp_file.write_bytes(orjson.dumps(
+                    self.metrics_history,
+                    option=orjson.OPT_INDENT_2 | JSON_OPTIONS
+                ))
+                os.replace(tmp_file, self.history_file)
+                
+                # Записи журнала теперь в истории
+                if self.journal is not None:
+                    self.journal.close()
+                    self.journal = None
+                if self.journal_file.exists():
+                    self.journal_file.unlink()
+                self.pending = 0
                 
             logger.info("История метрик сохранена")
             
         except Exception as e:
             logger.error(f"Ошибка сохранения истории: {str(e)}")
             
+    def close(self) -> None:
+        """
+        Сохранение истории с записями журнала
+        """
+        with self.lock:
+            if self.pending:
+                self._save_history()
+            
+    def _index(self, kind: str) -> None:
+        """
+        Упорядочивание записей истории по времени и построение индекса
+        
+        Args:
+            kind: "metrics" или "errors"
+        """
+        entries = self.metrics_history[kind]
+        epochs = [_epoch(entry["timestamp"]) for entry in entries]
+        if any(a > b for a, b in zip(epochs, epochs[1:])):
+            order = sorted(range(len(entries)), key=epochs.__getitem__)
+            entries[:] = [entries[i] for i in order]
+            epochs = [epochs[i] for i in order]
+        self.epochs[kind] = epochs
+        
+    def _append(self, kind: str, entry: Dict, epoch: float) -> None:
+        """
+        Добавление записи в историю с сохранением порядка по времени
+        
+        Args:
+            kind: "metrics" или "errors"
+            entry: запись
+            epoch: время записи в секундах эпохи
+        """
+        entries = self.metrics_history[kind]
+        epochs = self.epochs[kind]
+        if epochs and epoch < epochs[-1]:
+            # Часы переведены назад: запись вставляется по порядку времени
+            index = bisect.bisect_right(epochs, epoch)
+            epochs.insert(index, epoch)
+            entries.insert(index, entry)
+        else:
+            epochs.append(epoch)
+            entries.append(entry)
+            
+    def _range(self, kind: str, start_date: Optional[str], end_date: Optional[str]) -> List[Dict]:
+        """
+        Записи истории в диапазоне дат
+        
+        Args:
+            kind: "metrics" или "errors"
+            start_date: начальная дата (включительно)
+            end_date: конечная дата (включительно)
+            
+        Returns:
+            List[Dict]: записи по возрастанию времени
+        """
+        epochs = self.epochs[kind]
+        start = bisect.bisect_left(epochs, _epoch(start_date)) if start_date else 0
+        end = bisect.bisect_right(epochs, _epoch(end_date)) if end_date else len(epochs)
+        return self.metrics_history[kind][start:max(start, end)]
+        
     def add_metrics(self,
                    metrics: Dict[str, float],
                    metadata: Optional[Dict] = None) -> None:
@@ -90,21 +340,23 @@ class MetricsMonitor:
         """
         try:
             # Добавляем метрики
+            now = datetime.now()
             entry = {
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now.isoformat(),
                 "metrics": metrics
             }
             
             if metadata:
                 entry["metadata"] = metadata
                 
-            self.metrics_history["metrics"].append(entry)
-            
-            # Обновляем summary
-            self._update_summary()
-            
-            # Сохраняем историю
-            self._save_history()
+            with self.lock:
+                self._append("metrics", entry, now.timestamp())
+                
+                # Обновляем summary
+                self._update_summary(metrics)
+                
+                # Сохраняем запись в журнал
+                self._journal_entry("metrics", entry)
             
             logger.info("Метрики добавлены")
             
@@ -123,48 +375,47 @@ class MetricsMonitor:
         """
         try:
             # Добавляем ошибку
+            now = datetime.now()
             entry = {
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now.isoformat(),
                 "error": error
             }
             
             if metadata:
                 entry["metadata"] = metadata
                 
-            self.metrics_history["errors"].append(entry)
-            
-            # Обновляем summary
-            self.metrics_history["summary"]["total_errors"] += 1
-            
-            # Сохраняем историю
-            self._save_history()
+            with self.lock:
+                self._append("errors", entry, now.timestamp())
+                
+                # Обновляем summary
+                self.metrics_history["summary"]["total_errors"] += 1
+                
+                # Сохраняем запись в журнал
+                self._journal_entry("errors", entry)
             
             logger.info("Ошибка добавлена")
             
         except Exception as e:
             logger.error(f"Ошибка добавления ошибки: {str(e)}")
             
-    def _update_summary(self) -> None:
+    def _update_summary(self, metrics: Dict[str, float]) -> None:
         """
-        Обновление сводки метрик
+        Обновление сводки метрик добавленной записью
+        
+        Args:
+            metrics: метрики добавленной записи
         """
         try:
-            metrics = self.metrics_history["metrics"]
+            summary = self.metrics_history["summary"]
             
-            if not metrics:
-                return
-                
             # Обновляем количество обработанных
-            self.metrics_history["summary"]["total_processed"] = len(metrics)
-            
-            # Считаем средние метрики
-            precisions = [m["metrics"].get("precision", 0.0) for m in metrics]
-            recalls = [m["metrics"].get("recall", 0.0) for m in metrics]
-            f1_scores = [m["metrics"].get("f1", 0.0) for m in metrics]
+            count = len(self.metrics_history["metrics"])
+            summary["total_processed"] = count
             
-            self.metrics_history["summary"]["average_precision"] = np.mean(precisions)
-            self.metrics_history["summary"]["average_recall"] = np.mean(recalls)
-            self.metrics_history["summary"]["average_f1"] = np.mean(f1_scores)
+            # Средние метрики считаются по накопленным суммам
+            for name in SUMMARY_METRICS:
+                self.sums[name] += metrics.get(name, 0.0)
+                summary[f"average_{name}"] = float(self.sums[name]) / count
             
         except Exception as e:
             logger.error(f"Ошибка обновления сводки: {str(e)}")
@@ -186,9 +437,7 @@ class MetricsMonitor:
         """
         try:
             # Считаем метрики
-            precision, recall, f1, _ = precision_recall_fscore_support(
-                y_true, y_pred, average=average
-            )
+            precision, recall, f1 = _prf(y_true, y_pred, average)
             
             metrics = {
                 "precision": precision,
@@ -228,17 +477,7 @@ class MetricsMonitor:
             List[Dict]: история метрик
         """
         try:
-            metrics = self.metrics_history["metrics"]
-            
-            if start_date:
-                start = datetime.fromisoformat(start_date)
-                metrics = [m for m in metrics if datetime.fromisoformat(m["timestamp"]) >= start]
-                
-            if end_date:
-                end = datetime.fromisoformat(end_date)
-                metrics = [m for m in metrics if datetime.fromisoformat(m["timestamp"]) <= end]
-                
-            return metrics
+            return self._range("metrics", start_date, end_date)
             
         except Exception as e:
             logger.error(f"Ошибка получения истории: {str(e)}")
@@ -258,17 +497,7 @@ class MetricsMonitor:
             List[Dict]: история ошибок
         """
         try:
-            errors = self.metrics_history["errors"]
-            
-            if start_date:
-                start = datetime.fromisoformat(start_date)
-                errors = [e for e in errors if datetime.fromisoformat(e["timestamp"]) >= start]
-                
-            if end_date:
-                end = datetime.fromisoformat(end_date)
-                errors = [e for e in errors if datetime.fromisoformat(e["timestamp"]) <= end]
-                
-            return errors
+            return self._range("errors", start_date, end_date)
             
         except Exception as e:
             logger.error(f"Ошибка получения истории ошибок: {str(e)}")
@@ -291,6 +520,7 @@ class MetricsMonitor:
             values = [m["metrics"].get(metric_name, 0.0) for m in metrics]
             
             # Строим график
+            plt, sns = _plotting()
             plt.figure(figsize=(10, 6))
             sns.set_style("whitegrid")
             plt.plot(timestamps, values, marker="o")
@@ -327,6 +557,7 @@ class MetricsMonitor:
             timestamps = [datetime.fromisoformat(e["timestamp"]) for e in errors]
             
             # Строим график
+            plt, sns = _plotting()
             plt.figure(figsize=(10, 6))
             sns.set_style("whitegrid")
             plt.hist(timestamps, bins=20)
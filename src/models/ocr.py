@@ -5,6 +5,8 @@ import logging
 import os
 from pathlib import Path
 import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import easyocr
 from google.cloud import vision
 from google.oauth2 import service_account
@@ -12,6 +14,20 @@ import torch
 
 logger = logging.getLogger("OCRProcessor")
 
+# Число потоков для параллельной обработки областей одного счета
+OCR_WORKERS = 4
+
+@lru_cache(maxsize=4)
+def _get_easyocr_reader(languages: tuple, gpu: bool) -> easyocr.Reader:
+    """
+    Общий экземпляр EasyOCR для набора языков
+    
+    Веса моделей загружаются один раз на процесс и разделяются всеми
+    экземплярами OCRProcessor.
+    """
+    logger.info(f"Инициализация EasyOCR с языками: {list(languages)}")
+    return easyocr.Reader(list(languages), gpu=gpu)
+
 class OCRProcessor:
     def __init__(self, 
                  ocr_engine: str = 'easyocr',
@@ -29,8 +45,7 @@ class OCRProcessor:
         self.languages = languages
         
         if self.ocr_engine == 'easyocr':
-            logger.info(f"Инициализация EasyOCR с языками: {languages}")
-            self.reader = easyocr.Reader(languages, gpu=torch.cuda.is_available())
+            self.reader = _get_easyocr_reader(tuple(languages), torch.cuda.is_available())
             self.client = None
         elif self.ocr_engine == 'google':
             if not google_credentials_path:
@@ -74,6 +89,55 @@ class OCRProcessor:
         # Предобработка изображения
         processed_image = self._preprocess_image(image)
         
+        return self._recognize_processed(processed_image)
+        
+    def recognize_regions(self,
+                          image: np.ndarray,
+                          regions: Dict[str, List[int]]) -> Dict[str, str]:
+        """
+        Распознавание текста в нескольких областях изображения
+        
+        Предобработка областей идет параллельно в потоках (OpenCV отпускает
+        GIL). EasyOCR распознает области по очереди, пока следующие еще
+        предобрабатываются; запросы к Google Cloud Vision отправляются
+        одновременно.
+        
+        Args:
+            image: исходное изображение
+            regions: области для распознавания {название: [x1, y1, x2, y2]}
+            
+        Returns:
+            Dict[str, str]: распознанный текст для каждой области
+        """
+        if not regions:
+            return {}
+            
+        names = list(regions)
+        crops = []
+        for name in names:
+            x1, y1, x2, y2 = regions[name]
+            crops.append(image[y1:y2, x1:x2])
+            
+        with ThreadPoolExecutor(max_workers=min(OCR_WORKERS, len(names))) as pool:
+            processed = pool.map(self._preprocess_image, crops)
+            if self.ocr_engine == 'google':
+                texts = list(pool.map(self._recognize_processed, processed))
+            else:
+                # Модель EasyOCR не потокобезопасна
+                texts = [self._recognize_processed(processed_image) for processed_image in processed]
+                
+        return dict(zip(names, texts))
+        
+    def _recognize_processed(self, processed_image: np.ndarray) -> str:
+        """
+        Распознавание текста на предобработанном изображении
+        
+        Args:
+            processed_image: изображение после _preprocess_image
+            
+        Returns:
+            str: распознанный текст
+        """
         # Распознавание текста
         if self.ocr_engine == 'easyocr':
             results = self.reader.readtext(processed_image)